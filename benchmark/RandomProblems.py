@@ -0,0 +1,44 @@
+from problem.ProblemStatement import Problem
+from numerical.MatrixExponential import calculate_free_movement
+from numpy import eye, zeros, column_stack
+from numpy.linalg import matrix_rank, eigvals
+from numpy.random import default_rng
+
+
+def is_controllable(A, B) -> bool:
+    """
+    Критерий Калмана: ранг матрицы [B, AB, ..., A^(n-1)B] равен n
+    """
+    n = len(A)
+    blocks = [B]
+    for _ in range(n - 1):
+        blocks.append(A.dot(blocks[-1]))
+
+    return matrix_rank(column_stack(blocks)) == n
+
+
+def generate_controllable_problem(n: int, r: int, m: int, N: int, T: float, seed: int = 0,
+                                  growth: float = 0.1) -> Problem:
+    """
+    Случайная задача с управляемой системой и заведомо допустимыми терминальными условиями
+    :param growth: наибольшая вещественная часть собственных значений A (ограничивает рост exp(At))
+    """
+    rng = default_rng(seed)
+    while True:
+        A = rng.normal(size=(n, n)) / n ** 0.5
+        A -= max(eigvals(A).real.max() - growth, 0.) * eye(n)
+        B = rng.normal(size=(n, r))
+        if is_controllable(A, B):
+            break
+
+    L1 = -rng.uniform(1., 3., size=r)
+    L2 = rng.uniform(1., 3., size=r)
+    x0 = rng.normal(size=n)
+    H = rng.normal(size=(m, n))
+
+    # Цель g достигается постоянным управлением строго внутри ограничений, поэтому задача допустима во всех режимах
+    u = rng.uniform(L1 / 2, L2 / 2)
+    g = H.dot(calculate_free_movement(A, B.dot(u), x0, T))
+
+    return Problem(A=A, B=B, C=zeros(n), L1=L1, L2=L2, x0=x0, H=H, g=g, Q=zeros((n, n)), R=eye(r), d=zeros(r),
+                   c=rng.normal(size=n), T=T, N=N)
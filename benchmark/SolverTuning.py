@@ -0,0 +1,152 @@
+from problem.ProblemStatement import Problem
+from control.ParametricControl import get_mode
+from control.SolverProfiles import load_profiles, save_profiles
+from benchmark.RandomProblems import generate_controllable_problem
+from numpy import median, array, abs as np_abs
+from coptpy import Envr, COPT, CoptError
+from itertools import product
+from time import perf_counter
+import argparse
+import json
+import sys
+import os
+
+
+# Перебираемые параметры решателя: значение -1 --- выбор решателя
+GRID = {
+    'Presolve': (-1, 0),
+    'Scaling': (-1, 0),
+    'BarOrder': (-1, 0, 1),
+    'Threads': (-1, 1),
+}
+
+
+def get_settings(grid: dict = None) -> list:
+    """
+    Все сочетания значений параметров; значение по умолчанию из сетки в настройку не входит
+    """
+    grid = GRID if grid is None else grid
+    names = list(grid)
+
+    return [{name: value for name, value in zip(names, values) if value != -1}
+            for values in product(*[grid[name] for name in names])]
+
+
+def get_tuning_cases():
+    """
+    Представительные задачи: малые и большие системы, одно и два управления (размер ограничен так,
+    чтобы модели всех режимов решались за доли секунды)
+    """
+    cases = []
+    for n, r, N in product((4, 8), (1, 2), (20, 40)):
+        cases.append({'n': n, 'r': r, 'm': n // 2, 'N': N, 'T': 10., 'seed': len(cases)})
+
+    return cases
+
+
+def solve_case(P: Problem, mode: str, env: Envr, parameters: dict, repeats: int = 3):
+    """
+    Решение задачи с заданными параметрами решателя (модель строится заново для каждого запуска,
+    время построения не учитывается)
+    :return: 1) медиана времени решения, с, 2) статус, 3) значение целевой функции, 4) терминальная невязка
+    """
+    build, order, title = get_mode(mode)
+    times = []
+    for _ in range(repeats):
+        M = env.createModel(title)
+        M.setParam(COPT.Param.Logging, 0)
+        for name, value in parameters.items():
+            M.setParam(name, value)
+        x, terminal = build(M, P)
+
+        start = perf_counter()
+        M.solve()
+        times.append(perf_counter() - start)
+
+    if M.status != COPT.OPTIMAL:
+        return float(median(times)), M.status, None, None
+    activity = array(terminal.getInfo(COPT.Info.Slack).tolist())
+    bound = array(terminal.getInfo(COPT.Info.LB).tolist())
+
+    return float(median(times)), M.status, M.objval, float(np_abs(activity - bound).max())
+
+
+def tune_mode(mode: str, cases=None, grid: dict = None, repeats: int = 3, tolerance: float = 1e-6, env: Envr = None):
+    """
+    Подбор параметров решателя для режима: каждая настройка сетки проверяется на всех задачах.
+    Точность настройки --- относительное отклонение целевой функции от решения с параметрами решателя
+    по умолчанию и терминальная невязка (обе не больше tolerance); лучшая настройка --- точная на всех задачах
+    с наименьшим суммарным временем решения
+    :param grid: перебираемые значения параметров (по умолчанию GRID)
+    :return: словарь: mode, best --- лучшая настройка, records --- записи по настройкам
+    """
+    if cases is None:
+        cases = get_tuning_cases()
+    if env is None:
+        env = Envr()
+    problems = [generate_controllable_problem(**case) for case in cases]
+
+    # Эталонные решения; задачи, не решённые с параметрами по умолчанию, в подборе не участвуют
+    references = []
+    for case, P in zip(cases, problems):
+        try:
+            _, status, objective, _ = solve_case(P, mode, env, {}, 1)
+        except CoptError:
+            status = None
+        if status == COPT.OPTIMAL:
+            references.append((case, P, objective))
+
+    records = []
+    for parameters in get_settings(grid):
+        record = {'parameters': parameters, 'time': 0., 'accurate': True, 'cases': []}
+        for case, P, reference in references:
+            try:
+                time, status, objective, residual = solve_case(P, mode, env, parameters, repeats)
+            except CoptError as error:
+                time, status, objective, residual = None, None, None, str(error)
+            scale = max(1., float(np_abs(P.g).max()))
+            accurate = (objective is not None and abs(objective - reference) <= tolerance * max(1., abs(reference))
+                        and residual <= tolerance * scale)
+            record['cases'].append(dict(case, time=time, status=status, objective=objective, residual=residual))
+            record['accurate'] &= accurate
+            record['time'] += time if time is not None else 0.
+        records.append(record)
+
+    accurate = [record for record in records if record['accurate']]
+    best = min(accurate, key=lambda record: record['time'])['parameters'] if accurate else {}
+
+    return {'mode': mode, 'best': best, 'records': records}
+
+
+def main(arguments=None) -> None:
+    parser = argparse.ArgumentParser(description='Solver parameter tuning per control mode')
+    parser.add_argument('output', help='JSON file of solver profiles (updated for the tuned modes)')
+    parser.add_argument('--modes', nargs='+', default=['constant', 'linear', 'quadratic'])
+    parser.add_argument('--grid', help='JSON object of parameter values to sweep (default: GRID)')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--tolerance', type=float, default=1e-6)
+    parser.add_argument('--report', help='JSON file for the timings and accuracy of every setting')
+    arguments = parser.parse_args(arguments)
+
+    grid = None if arguments.grid is None else json.loads(arguments.grid)
+    profiles = load_profiles(arguments.output) if os.path.exists(arguments.output) else {}
+    env = Envr()
+    results = []
+    for mode in arguments.modes:
+        result = tune_mode(mode, grid=grid, repeats=arguments.repeats, tolerance=arguments.tolerance, env=env)
+        results.append(result)
+
+        # Профиль режима заменяется целиком: параметры прежнего профиля, не вошедшие в лучшую настройку, сбрасываются
+        profiles[mode] = result['best']
+        times = {json.dumps(record['parameters']): record['time'] for record in result['records'] if record['accurate']}
+        print('{}: {} ({} s, solver defaults {} s)'.format(mode, result['best'], times.get(json.dumps(result['best'])),
+                                                          times.get('{}')), file=sys.stderr)
+
+    save_profiles(arguments.output, profiles)
+    if arguments.report is not None:
+        with open(arguments.report, 'w') as file:
+            json.dump(results, file, indent=1)
+
+
+if __name__ == '__main__':
+    main()
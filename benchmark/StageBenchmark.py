@@ -0,0 +1,195 @@
+from problem.ProblemStatement import Problem
+from numerical.TerminalCoefficients import calculate_terminal_projections
+from numerical.Cache import PrecomputationCache, get_default_cache, set_default_cache
+from control.ParametricControl import get_mode
+from control.MatrixModel import get_values
+from movement.ObjectMovement import calculate_movement
+from benchmark.RandomProblems import generate_controllable_problem
+from numpy import median, abs as np_abs
+from coptpy import Envr, COPT, CoptError
+from itertools import product
+from time import perf_counter
+from datetime import datetime
+import tracemalloc
+import subprocess
+import platform
+import argparse
+import json
+import sys
+import os
+
+
+STAGES = ('precompute', 'build', 'solve', 'simulate')
+
+
+def run_stages(P: Problem, mode: str, env: Envr):
+    """
+    Однократное решение задачи по этапам: предвычисление, построение модели, решение, моделирование движения
+    :return: 1) times --- длительности этапов, с,
+             2) result --- статус решателя, количество итераций метода барьеров, значение целевой функции
+                и терминальная невязка
+    """
+    build, order, title = get_mode(mode)
+    times = {}
+
+    # Предвычисления выполняются с пустым кэшем, построение модели берёт их из кэша
+    start = perf_counter()
+    calculate_terminal_projections(P.A, P.B, P.C, P.x0, P.H, P.c, P.get_nodes(), order, basis=P.basis)
+    times['precompute'] = perf_counter() - start
+
+    start = perf_counter()
+    M = env.createModel(title)
+    M.setParam(COPT.Param.Logging, 0)
+    x, _ = build(M, P)
+    times['build'] = perf_counter() - start
+
+    start = perf_counter()
+    M.solve()
+    times['solve'] = perf_counter() - start
+
+    result = {'status': M.status, 'iterations': M.getAttr(COPT.Attr.BarrierIter), 'objective': None,
+              'residual': None}
+    if M.status != COPT.OPTIMAL:
+        return times, result
+
+    start = perf_counter()
+    _, x_grid, _ = calculate_movement(P, get_values(x).reshape(P.r, P.N, order))
+    times['simulate'] = perf_counter() - start
+
+    result['objective'] = M.objval
+    result['residual'] = float(np_abs(P.H.dot(x_grid[-1]) - P.g).max())
+
+    return times, result
+
+
+def run_case(case: dict, mode: str, env: Envr, repeats: int = 3, memory: bool = True, tolerance: float = 1e-5,
+             basis: str = 'global'):
+    """
+    Замер одного варианта: медианы длительностей этапов по repeats запускам и пиковая память этапов
+    (tracemalloc, отдельным запуском, чтобы не искажать время; память решателя вне Python не учитывается)
+    :param basis: базис полиномов управления на отрезках (см. Problem.basis)
+    """
+    P = generate_controllable_problem(**case)
+    P.basis = basis
+    record = dict(case, mode=mode, basis=basis, variables=P.r * P.N * get_mode(mode)[1])
+
+    previous_cache = get_default_cache()
+    try:
+        runs = []
+        for _ in range(repeats):
+            set_default_cache(PrecomputationCache())
+            runs.append(run_stages(P, mode, env))
+        times, result = runs[-1]
+        record.update(result)
+        record['times'] = {stage: float(median([run[0][stage] for run in runs])) for stage in times}
+
+        if memory:
+            set_default_cache(PrecomputationCache())
+            tracemalloc.start()
+            run_stages(P, mode, env)
+            record['peak_memory'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    except CoptError as error:
+        record.update(status=None, iterations=None, objective=None, residual=None, error=str(error))
+    finally:
+        set_default_cache(previous_cache)
+
+    # Проверка точности: ускорение не должно достигаться ценой нарушения терминальных условий
+    scale = max(1., float(np_abs(P.g).max()))
+    record['accurate'] = record['residual'] is not None and record['residual'] <= tolerance * scale
+
+    return record
+
+
+def get_default_cases():
+    cases = []
+    for n, r, N, T in product((4, 8), (1, 2), (20, 40), (5., 10.)):
+        cases.append({'n': n, 'r': r, 'm': n // 2, 'N': N, 'T': T, 'seed': len(cases)})
+
+    return cases
+
+
+def get_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(cases=None, modes=('constant', 'linear', 'quadratic'), repeats: int = 3, memory: bool = True,
+                  bases=('global',)):
+    """
+    Замер всех вариантов во всех режимах и базисах
+    :return: словарь с описанием окружения (в т.ч. коммита) и записями по вариантам
+    """
+    if cases is None:
+        cases = get_default_cases()
+
+    env = Envr()
+    records = [run_case(case, mode, env, repeats, memory, basis=basis)
+               for case in cases for mode in modes for basis in bases]
+
+    return {
+        'revision': get_revision(),
+        'date': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeats': repeats,
+        'records': records,
+    }
+
+
+def get_case_key(record: dict):
+    # Записи прогонов без базиса относятся к базису 'global'
+    return tuple(record[name] for name in ('mode', 'n', 'r', 'm', 'N', 'T', 'seed')) + (record.get('basis', 'global'),)
+
+
+def compare_results(baseline: dict, current: dict):
+    """
+    Сравнение двух прогонов: отношение длительностей этапов (текущий/базовый) для общих вариантов
+    и варианты, потерявшие точность
+    """
+    baseline_records = {get_case_key(record): record for record in baseline['records']}
+    comparison = []
+    for record in current['records']:
+        key = get_case_key(record)
+        if key not in baseline_records or 'times' not in record or 'times' not in baseline_records[key]:
+            continue
+        old = baseline_records[key]
+        comparison.append({
+            'case': key,
+            'ratios': {stage: record['times'][stage] / old['times'][stage]
+                       for stage in record['times'] if old['times'].get(stage)},
+            'regressed_accuracy': old['accurate'] and not record['accurate'],
+        })
+
+    return comparison
+
+
+def main(arguments=None) -> None:
+    parser = argparse.ArgumentParser(description='Stage-level benchmark of optimal control search')
+    parser.add_argument('output', help='path of the JSON results file')
+    parser.add_argument('--modes', nargs='+', default=['constant', 'linear', 'quadratic'])
+    parser.add_argument('--bases', nargs='+', default=['global'], choices=['global', 'local'])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc pass')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare with (stored under "comparison")')
+    arguments = parser.parse_args(arguments)
+
+    results = run_benchmark(modes=arguments.modes, repeats=arguments.repeats, memory=not arguments.no_memory,
+                            bases=arguments.bases)
+    if arguments.baseline is not None:
+        with open(arguments.baseline) as file:
+            results['comparison'] = compare_results(json.load(file), results)
+
+    with open(arguments.output, 'w') as file:
+        json.dump(results, file, indent=1)
+
+    failed = [get_case_key(record) for record in results['records'] if not record['accurate']]
+    for key in failed:
+        print('Inaccurate or unsolved case: {}'.format(key), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+from problem.ProblemStatement import Problem
+from control.MatrixModel import get_values, solve_model
+from control.ParametricControl import get_mode
+from control.SolverProfiles import apply_profile
+from control.PiecewiseConstantControl import is_native_supported, solve_piecewise_constant_control_natively
+from control.PiecewisePolynomialControl import PiecewisePolynomialControl
+from numpy import array, linspace, diff, maximum, full, nan, zeros, ones, argsort, sort, concatenate, isfinite, where, \
+    abs as np_abs
+from coptpy import Envr, COPT
+from copy import copy
+
+
+def calculate_refinement_indicators(control: PiecewisePolynomialControl, L1, L2, tolerance: float = 1e-6):
+    """
+    Индикаторы измельчения отрезков
+    :return: 1) error --- оценка вклада отрезка в ошибку приближения h_k*change_k^2, где change_k --- наибольшее
+                по входам изменение управления на отрезке и его скачков в концах отрезка, отнесённое к L2 - L1,
+             2) switching --- признак отрезка, на конце которого или рядом с которым прямое ограничение
+                становится активным или перестаёт быть активным
+    """
+    nodes = control.nodes
+    left, right = control.get_end_values()
+
+    span = array(L2, dtype=float) - array(L1, dtype=float)
+    span = where(isfinite(span) & (span > 0), span, 1.)[:, None]
+
+    change = np_abs(right - left) / span
+    jumps = np_abs(left[:, 1:] - right[:, :-1]) / span
+    change[:, 1:] = maximum(change[:, 1:], jumps)
+    change[:, :-1] = maximum(change[:, :-1], jumps)
+
+    lower = array(L1, dtype=float)[:, None] + tolerance * span
+    upper = array(L2, dtype=float)[:, None] - tolerance * span
+    active_left = (left <= lower) | (left >= upper)
+    active_right = (right <= lower) | (right >= upper)
+    switching = active_left != active_right
+    boundary = active_right[:, :-1] != active_left[:, 1:]
+    switching[:, 1:] |= boundary
+    switching[:, :-1] |= boundary
+
+    return diff(nodes) * change.max(axis=0) ** 2, switching.any(axis=0)
+
+
+def refine_nodes(nodes, error, switching, budget: int, fraction: float = 0.5):
+    """
+    Деление пополам отрезков с переключением прямых ограничений и отрезков с оценкой ошибки не меньше
+    доли fraction от наибольшей
+    :param budget: наибольшее количество делимых отрезков
+    :return: новые узлы (совпадают с nodes, если делить нечего)
+    """
+    marked = switching | ((error >= fraction * error.max()) & (error > 0))
+
+    # Сначала делятся отрезки с переключением, затем --- в порядке убывания оценки ошибки
+    priority = error + 2. * switching * (error.max() + 1.)
+    order = argsort(-priority)
+    selected = sort(order[marked[order]][:max(budget, 0)])
+
+    midpoints = (nodes[selected] + nodes[selected + 1]) / 2
+
+    return sort(concatenate((nodes, midpoints)))
+
+
+def search_adaptive_control(P: Problem, mode: str = 'quadratic', initial_segments: int = 10, max_segments: int = None,
+                            tolerance: float = 1e-4, fraction: float = 0.5, backend: str = 'copt',
+                            env: Envr = None, parameters: dict = None):
+    """
+    Поиск управления на адаптивно измельчаемой сетке: решение начинается с равномерного разбиения на
+    initial_segments отрезков, после каждого решения делятся отрезки с активными прямыми ограничениями
+    и наибольшей оценкой ошибки приближения. Разбиения вложены, поэтому целевая функция не возрастает;
+    измельчение прекращается, когда её относительное уменьшение не больше tolerance,
+    количество отрезков достигло max_segments или делить нечего. Если решение на более мелком разбиении
+    не найдено, возвращается решение предыдущего разбиения.
+    Разбиения вложены, поэтому для разреженной A терминальные данные неподелённых отрезков берутся из данных
+    предыдущего разбиения (см. calculate_adjoint_segment_data) и экспоненты вычисляются только для новых отрезков.
+    Модели COPT решаются методом внутренней точки, который не принимает начального приближения, поэтому
+    с предыдущего разбиения начинает только собственный решатель (backend = 'native')
+    :param max_segments: наибольшее количество отрезков (по умолчанию P.N)
+    :param backend: для mode = 'constant' --- 'native' (собственный решатель с начальным приближением множителей
+                    с предыдущего разбиения) или 'copt'
+    :param parameters: параметры решателя, заменяющие профиль режима (см. SolverProfiles)
+    :return: 1) постановка задачи с найденными узлами (P.nodes),
+             2) коэффициенты управления, массив формы (r, N, order)
+    """
+    build, order, title = get_mode(mode)
+    if max_segments is None:
+        max_segments = P.N
+    native = mode == 'constant' and backend == 'native' and is_native_supported(P)
+
+    nodes = linspace(0, P.T, min(initial_segments, max_segments) + 1)
+    multipliers = None
+    previous = None
+    best = None
+    while True:
+        level = copy(P)
+        level.nodes = nodes
+        level.N = len(nodes) - 1
+
+        converged = False
+        if native:
+            u, candidate, objective, converged = solve_piecewise_constant_control_natively(level, multipliers)
+            values = u.reshape(level.r, level.N, 1)
+            # Множители без сходимости (например, у недопустимой задачи) не годятся как начальное приближение
+            multipliers = candidate if converged else None
+        if not converged:
+            if env is None:
+                env = Envr()
+            M = env.createModel(title)
+            M.setParam(COPT.Param.Logging, 0)
+            apply_profile(M, mode, parameters)
+            x, _ = build(M, level)
+            solve_model(M)
+            if M.status != COPT.OPTIMAL:
+                # После найденного решения неудача на более мелком разбиении означает численные трудности
+                if previous is not None:
+                    return best
+                # Грубое разбиение может не иметь допустимого управления: тогда делятся все отрезки
+                if level.N >= max_segments:
+                    return level, full((level.r, level.N, order), nan)
+                nodes = refine_nodes(nodes, zeros(level.N), ones(level.N, dtype=bool), max_segments - level.N)
+                continue
+            objective = M.objval
+            values = get_values(x).reshape(level.r, level.N, order)
+
+        if previous is not None and previous - objective <= tolerance * max(abs(objective), 1.):
+            return level, values
+        previous = objective
+        best = level, values
+
+        control = PiecewisePolynomialControl(values, nodes, level.basis)
+        error, switching = calculate_refinement_indicators(control, level.L1, level.L2)
+        refined = refine_nodes(nodes, error, switching, max_segments - level.N, fraction)
+        if len(refined) == len(nodes):
+            return level, values
+        nodes = refined
@@ -0,0 +1,134 @@
+from problem.ProblemStatement import Problem
+from numerical.TerminalCoefficients import calculate_terminal_projections
+from numerical.StateCost import calculate_state_cost_blocks
+from numerical.Cache import PrecomputationCache, get_default_cache
+from control.MatrixModel import has_state_cost, get_formulation
+from control.ParametricControl import ParametricController, get_mode
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from numpy import array, zeros, dtype, nan
+from coptpy import Envr, COPT
+from copy import copy
+from time import perf_counter
+import os
+
+
+# Состояние процесса-исполнителя: окружение решателя и построенные модели для разных T
+_worker_state = {}
+
+
+def get_record_type(P: Problem, order: int):
+    """
+    Тип записи результата: номер сценария, статус решателя, значение целевой функции,
+    время решения и коэффициенты управления
+    """
+    return dtype([('index', 'i8'), ('status', 'i4'), ('objective', 'f8'), ('time', 'f8'),
+                  ('coefficients', 'f8', (P.r, P.N, order))])
+
+
+def initialize_worker(P: Problem, mode: str, timeout: float, entries: dict) -> None:
+    """
+    Инициализация процесса-исполнителя: одно окружение решателя на всё время работы и
+    предвычисленные в родительском процессе данные, не зависящие от меняющихся параметров
+    """
+    cache = get_default_cache()
+    for key, entry in entries.items():
+        cache.put(key, entry)
+
+    _worker_state.clear()
+    _worker_state.update(P=P, mode=mode, timeout=timeout, env=Envr(), controllers={})
+
+
+def get_worker_controller(T: float) -> ParametricController:
+    controllers = _worker_state['controllers']
+    if T not in controllers:
+        P = copy(_worker_state['P'])
+        if P.nodes is not None:
+            P.nodes = P.nodes * (T / P.T)
+        P.T = T
+        controller = ParametricController(P, _worker_state['mode'], _worker_state['env'])
+        controller.M.setParam(COPT.Param.Logging, 0)
+        if _worker_state['timeout'] is not None:
+            controller.M.setParam(COPT.Param.TimeLimit, _worker_state['timeout'])
+        controllers[T] = controller
+
+    return controllers[T]
+
+
+def solve_scenario(index: int, scenario: dict):
+    """
+    Решение одного сценария в процессе-исполнителе: модель для данного T строится один раз,
+    далее меняется только правая часть терминальных ограничений
+    """
+    P = _worker_state['P']
+    controller = get_worker_controller(scenario.get('T', P.T))
+
+    start = perf_counter()
+    controller.update(x0=scenario.get('x0', P.x0), g=scenario.get('g', P.g))
+    values = controller.solve()
+
+    # Для сценариев без оптимального решения (недопустимых, прерванных по времени) значения не заполняются
+    optimal = controller.M.status == COPT.OPTIMAL
+    record = zeros(1, dtype=get_record_type(controller.P, controller.order))[0]
+    record['index'] = index
+    record['status'] = controller.M.status
+    record['objective'] = controller.M.objval if optimal else nan
+    record['time'] = perf_counter() - start
+    record['coefficients'] = values if optimal else nan
+
+    return record
+
+
+def prepare_scenario(scenario: dict) -> dict:
+    return {key: float(value) if key == 'T' else array(value, dtype=float) for key, value in scenario.items()}
+
+
+def precompute_shared_entries(P: Problem, order: int) -> dict:
+    """
+    Предвычисления для базового T, которые ищет в кэше построение модели в процессе-исполнителе, с теми же
+    аргументами и в том же базисе: проекции терминальных ограничений (в сжатой формулировке) и данные
+    отрезков для состояний в узлах и члена x(t)'*Q*x(t) (см. add_state_terms)
+    :return: записи кэша по ключам
+    """
+    shared = PrecomputationCache()
+    nodes = P.get_nodes()
+    formulation = get_formulation(P)
+    state_cost = has_state_cost(P.Q)
+    if formulation == 'condensed':
+        calculate_terminal_projections(P.A, P.B, P.C, P.x0, P.H, P.c, nodes, order, cache=shared, basis=P.basis)
+    if formulation == 'shooting' or state_cost:
+        calculate_state_cost_blocks(P.A, P.B, P.C, P.Q if state_cost else None, nodes, order, cache=shared,
+                                    basis=P.basis)
+
+    return dict(shared.entries)
+
+
+def solve_batch(P: Problem, scenarios, mode: str = 'quadratic', workers: int = None, timeout: float = None):
+    """
+    Решение набора вариантов задачи в пуле процессов
+    :param P: базовая постановка задачи
+    :param scenarios: итерируемый набор словарей с изменяемыми параметрами x0, g и T
+    :param workers: количество процессов (по умолчанию --- количество процессоров)
+    :param timeout: ограничение времени решения одного сценария, с
+    :return: генератор записей (см. get_record_type) в порядке завершения решения
+    """
+    _, order, _ = get_mode(mode)
+    if workers is None:
+        workers = os.cpu_count()
+
+    # Предвычисления для базового T выполняются один раз и передаются всем процессам
+    entries = precompute_shared_entries(P, order)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=initialize_worker,
+                             initargs=(P, mode, timeout, entries)) as executor:
+        # Количество одновременно поставленных задач ограничено, чтобы не хранить в памяти все сценарии
+        pending = set()
+        for index, scenario in enumerate(scenarios):
+            pending.add(executor.submit(solve_scenario, index, prepare_scenario(scenario)))
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
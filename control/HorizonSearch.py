@@ -0,0 +1,192 @@
+from problem.ProblemStatement import Problem
+from numerical.TerminalCoefficients import calculate_terminal_projections
+from control.MatrixModel import get_name, get_values, solve_model
+from control.ParametricControl import get_mode
+from control.SolverProfiles import apply_profile
+from control.SplineControl import add_control_coefficients_vars, add_smoothness_constraints, add_straight_constraints
+from instrumentation.Telemetry import stage, count
+from numpy import asarray, zeros, ones, abs as np_abs
+from coptpy import Envr, Model, COPT
+from copy import copy
+
+
+class FeasibilityProbe(object):
+
+    def __init__(self, P: Problem, order: int, env: Envr = None, subdivisions: int = None) -> None:
+        """
+        Задача ЛП о наименьшей невязке терминальных ограничений при горизонте T:
+        min |s+|_1 + |s-|_1 при HD(T)*p + s+ - s- = g - H*xT(T) и прямых ограничениях на управление.
+        Модель строится один раз в нормированном базисе на узлах theta_k = t_k/T: условия непрерывности
+        (умноженные на h_k^d) и условия на коэффициенты Бернштейна от T не зависят, поэтому при смене T
+        обновляются только коэффициенты и правая часть терминальных строк, а симплекс-метод начинается
+        с базиса предыдущей пробы
+        :param subdivisions: количество частей отрезка для прямых ограничений (см. build_spline_model)
+        """
+        self.P = P
+        self.order = order
+        self.fractions = P.get_nodes() / P.T
+        if subdivisions is None:
+            subdivisions = 1 if order <= 2 else 2
+
+        env = Envr() if env is None else env
+        self.M: Model = env.createModel('Minimum Time Feasibility Probing')
+        self.M.setParam(COPT.Param.Logging, 0)
+        self.M.setParam(COPT.Param.LpMethod, 1)
+
+        with stage('build'):
+            self.p = add_control_coefficients_vars(self.M, P.r, P.N, order)
+            add_smoothness_constraints(self.M, P.r, self.fractions, order, order - 1, self.p, basis='local')
+            add_straight_constraints(self.M, P.L1, P.L2, P.r, self.fractions, order, self.p, subdivisions,
+                                     basis='local')
+
+            # Коэффициенты терминальных строк задаются при первой пробе: все элементы HD(T) входят в модель
+            self.s = self.M.addMVar(2 * P.m, lb=0., vtype=COPT.CONTINUOUS, nameprefix=get_name('s', False))
+            size = P.r * P.N * order
+            self.terminal = self.M.addConstr(ones((P.m, size)) @ self.p + self.s[:P.m] - self.s[P.m:] == zeros(P.m))
+            self.M.setObjective(ones(2 * P.m) @ self.s, sense=COPT.MINIMIZE)
+
+        # Пары (строка, переменная) элементов терминальных строк в порядке строк
+        self.rows = [row for row in self.terminal.tolist() for _ in range(size)]
+        self.columns = self.p.tolist() * P.m
+        self.basis = None
+
+    def get_problem(self, T: float) -> Problem:
+        """
+        Постановка задачи с горизонтом T и узлами, подобными узлам исходной постановки, в базисе 'local'.
+        Узлы задаются явно теми же массивами, что и в пробе evaluate(T), поэтому проекции построенной
+        по постановке модели берутся из кэша
+        """
+        P = copy(self.P)
+        P.T = T
+        P.nodes = self.fractions * T
+        P.basis = 'local'
+
+        return P
+
+    def evaluate(self, T: float) -> float:
+        """
+        Наименьшая невязка |HD(T)*p - h(T)|_1 терминальных ограничений при горизонте T
+        (бесконечность, если задача ЛП не решена)
+        """
+        P = self.P
+        nodes = self.fractions * T
+        HxT, HD, _ = calculate_terminal_projections(P.A, P.B, P.C, P.x0, P.H, P.c, nodes, self.order, basis='local')
+        h = P.g - HxT
+
+        self.M.setCoeffs(self.rows, self.columns, HD.reshape(-1, P.m).T.reshape(-1).tolist())
+        self.terminal.setInfo(COPT.Info.LB, h)
+        self.terminal.setInfo(COPT.Info.UB, h)
+        if self.basis is not None:
+            self.M.setBasis(*self.basis)
+
+        count('horizon_probes')
+        solve_model(self.M)
+        if self.M.status != COPT.OPTIMAL:
+            self.basis = None
+
+            return float('inf')
+
+        self.basis = self.M.getVarBasis(), self.M.getConstrBasis()
+
+        return self.M.objval
+
+
+def search_minimum_time(P: Problem, mode: str = 'quadratic', T_min: float = 0., T_max: float = None,
+                        tolerance: float = 1e-3, feasibility: float = 1e-7, max_probes: int = 50,
+                        max_expansions: int = 10, env: Envr = None, parameters: dict = None):
+    """
+    Поиск наименьшего горизонта T, при котором терминальные ограничения H*x(T) = g выполнимы управлением режима
+    mode при прямых ограничениях L1 <= u <= L2. Наименьшая невязка rho(T) (см. FeasibilityProbe) убывает
+    до нуля в искомой точке; по двум недопустимым пробам нуль rho оценивается методом секущих, причём проба
+    ставится на tolerance*T/2 за оценку, чтобы одной следующей пробой замкнуть интервал с другой стороны.
+    Если проба по секущей недопустима, но не уменьшила невязку вдвое, или две пробы по одной оценке допустимы,
+    следующая проба делит интервал пополам.
+    Для каждого T вычисляются только проекции (экспонента одна на каждую длину отрезка, результат кэшируется),
+    затем решается задача ЛП с базиса предыдущей пробы; в конце решается исходная задача оптимизации
+    :param T_min: горизонт, при котором ограничения заведомо невыполнимы (при 0 невязка rho(0) = |g - H*x0|_1
+                  вычисляется без решения)
+    :param T_max: начальная верхняя граница (по умолчанию P.T); при недопустимости удваивается
+                  не более max_expansions раз
+    :param tolerance: относительная длина итогового интервала [T_low, T_high]
+    :param feasibility: относительная невязка, при которой ограничения считаются выполнимыми
+    :param parameters: параметры решателя итоговой задачи, заменяющие профиль режима (см. SolverProfiles)
+    :return: 1) постановка задачи с найденным горизонтом T_high (допустимым) в базисе 'local',
+             2) коэффициенты управления в базисе постановки, массив формы (r, N, order),
+             3) history --- пробы в порядке вычисления, список пар (T, rho)
+    """
+    build, order, title = get_mode(mode)
+    if T_max is None:
+        T_max = P.T
+    env = Envr() if env is None else env
+
+    probe = FeasibilityProbe(P, order, env)
+    x0 = asarray(P.x0, dtype=float)
+    g = asarray(P.g, dtype=float)
+    scale = max(1., np_abs(g).sum(), np_abs(P.H @ x0).sum())
+
+    history = []
+
+    def evaluate(T: float) -> float:
+        residual = probe.evaluate(T)
+        history.append((T, residual))
+
+        return residual
+
+    # Недопустимые пробы с наибольшими T (для секущей) и границы интервала
+    if T_min > 0:
+        infeasible = [(T_min, evaluate(T_min))]
+        if infeasible[0][1] <= feasibility * scale:
+            raise ValueError('Terminal conditions are reachable already for T_min = {}'.format(T_min))
+    else:
+        infeasible = [(0., float(np_abs(g - P.H @ x0).sum()))]
+        history.append(infeasible[0])
+    T_low = infeasible[0][0]
+
+    T_high = T_max
+    for expansion in range(max_expansions + 1):
+        residual = evaluate(T_high)
+        if residual <= feasibility * scale:
+            break
+        T_low = T_high
+        infeasible.append((T_high, residual))
+        T_high *= 2
+    else:
+        raise ValueError('Terminal conditions are not reachable for T <= {}'.format(T_high / 2))
+
+    bisect = True
+    overshoot = False
+    while T_high - T_low > tolerance * T_high and len(history) < max_probes:
+        (T_a, rho_a), (T_b, rho_b) = infeasible[-2:] if len(infeasible) > 1 else (infeasible[0], infeasible[0])
+        candidate = (T_low + T_high) / 2
+        secant = not bisect and rho_a > rho_b
+        if secant:
+            shift = tolerance * T_high / 2
+            estimate = T_b + rho_b * (T_b - T_a) / (rho_a - rho_b) + (-shift if overshoot else shift)
+            if T_low < estimate < T_high:
+                candidate = estimate
+            else:
+                secant = False
+
+        residual = evaluate(candidate)
+        if residual <= feasibility * scale:
+            T_high = candidate
+            # После двух допустимых проб по одной и той же оценке секущая больше не приближает к нулю
+            bisect = secant and overshoot
+            overshoot = secant and not overshoot
+        else:
+            T_low = candidate
+            infeasible.append((candidate, residual))
+            bisect = secant and residual > rho_b / 2
+            overshoot = False
+
+    # Решение исходной задачи на допустимом горизонте: модель строится в базисе 'local' на узлах пробы T_high,
+    # поэтому терминальные проекции уже в кэше
+    problem = probe.get_problem(T_high)
+    M = env.createModel(title)
+    M.setParam(COPT.Param.Logging, 0)
+    apply_profile(M, mode, parameters)
+    x, terminal = build(M, problem)
+    solve_model(M, terminal)
+    values = get_values(x).reshape(problem.r, problem.N, order) if M.status == COPT.OPTIMAL else None
+
+    return problem, values, history
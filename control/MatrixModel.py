@@ -0,0 +1,288 @@
+from numerical.StateCost import calculate_state_cost_blocks
+from instrumentation.Telemetry import stage, count, is_enabled, record_solve
+from numpy import array, zeros, ones, arange, repeat, tile, concatenate, asarray, diff, abs as np_abs
+from numpy.linalg import eigvals
+from scipy.sparse import csr_matrix, kron, block_diag, vstack, issparse
+from coptpy import Model, MVar, MConstr, COPT
+from math import factorial
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_name(name: str, names: bool) -> str:
+    """
+    Имена ограничений задаются только по требованию: их формирование замедляет построение модели
+    """
+    return name if names else ''
+
+
+def get_values(x: MVar):
+    """
+    Значения матричной переменной после решения, полученные одним обращением к решателю
+    """
+    return array(x.X.tolist()).reshape(x.shape)
+
+
+def calculate_power_row(t: float, order: int, derivative: int = 0):
+    """
+    Коэффициенты производной порядка derivative от мономов t^o, o = 0, ..., order-1
+    """
+    row = zeros(order)
+    for o in range(derivative, order):
+        row[o] = factorial(o) / factorial(o - derivative) * t ** (o - derivative)
+
+    return row
+
+
+def build_evaluation_matrix(r: int, N: int, order: int, times, derivative: int = 0, scales=None):
+    """
+    Матрица значений производной управления на отрезках: строка (i, k) содержит коэффициенты
+    выражения d^derivative/dt^derivative (sum_o p[i, k, o]*t^o) в момент times[k]
+    :param scales: множители строк отрезков (например, h_k^(-derivative) для нормированного времени)
+    """
+    powers = array([calculate_power_row(t, order, derivative) for t in times])
+    if scales is not None:
+        powers = powers * asarray(scales)[:, None]
+
+    rows = repeat(arange(r * N), order)
+    cols = arange(r * N * order)
+    values = tile(powers.reshape(-1), r)
+
+    return csr_matrix((values, (rows, cols)), shape=(r * N, r * N * order))
+
+
+def build_continuity_matrix(r: int, nodes, order: int, smoothness: int, basis: str = 'global'):
+    """
+    Матрица условий непрерывности управления и его производных до порядка smoothness-1 во внутренних узлах t_k,
+    k = 1, ..., N-1
+    :param basis: 'global' --- мономы t^o, 'local' --- мономы tau^o, tau = (t - t_k)/h_k: концы отрезка ---
+                  tau = 0 и tau = 1, производная по t равна производной по tau, делённой на h_k
+    """
+    N = len(nodes) - 1
+    previous_rows = array([i * N + k - 1 for i in range(r) for k in range(1, N)])
+    next_rows = previous_rows + 1
+
+    blocks = []
+    for derivative in range(smoothness):
+        if basis == 'local':
+            scales = diff(nodes) ** -float(derivative)
+            right = build_evaluation_matrix(r, N, order, ones(N), derivative, scales)
+            left = build_evaluation_matrix(r, N, order, zeros(N), derivative, scales)
+        else:
+            right = build_evaluation_matrix(r, N, order, nodes[1:], derivative)
+            left = build_evaluation_matrix(r, N, order, nodes[:-1], derivative)
+        blocks.append(right[previous_rows] - left[next_rows])
+
+    return csr_matrix(vstack(blocks))
+
+
+def calculate_gram_matrices(nodes, order: int, basis: str = 'global'):
+    """
+    Матрицы Грама мономов на отрезках: G[k, o1, o2] = int_(t_k)^(t_(k+1)) (t^(o1+o2)) dt
+    (для базиса 'local' --- int_(t_k)^(t_(k+1)) (tau^(o1+o2)) dt = h_k/(o1 + o2 + 1))
+    """
+    N = len(nodes) - 1
+    if basis == 'local':
+        degrees = arange(order)[:, None] + arange(order) + 1
+
+        return diff(nodes)[:, None, None] / degrees
+
+    G = zeros((N, order, order))
+    for k in range(N):
+        t1 = nodes[k]
+        t2 = nodes[k + 1]
+        for o1 in range(order):
+            for o2 in range(order):
+                degree = o1 + o2 + 1
+                G[k, o1, o2] = (t2 ** degree - t1 ** degree) / degree
+
+    return G
+
+
+def build_quadratic_matrix(R, nodes, order: int, basis: str = 'global'):
+    """
+    Матрица квадратичной формы int_0^T(u(t)'*R*u(t))dt по коэффициентам p[i, k, o]
+    """
+    R = array(R, dtype=float)
+    R[np_abs(R) <= 1e-15] = 0.
+    G = calculate_gram_matrices(nodes, order, basis)
+
+    return csr_matrix(kron(csr_matrix(R), block_diag(list(G))))
+
+
+def add_terminal_constraints_matrix(M: Model, HD, h, x: MVar, names: bool = False):
+    """
+    Терминальные ограничения sum_(i, k, o) (H*D[i, k, o])*p[i, k, o] = h одним блоком
+    :param HD: массив формы (r, N, order, m)
+    """
+    m = HD.shape[-1]
+
+    return M.addConstr(HD.reshape(-1, m).T @ x == h, name=get_name('terminal_constraint', names))
+
+
+def has_state_cost(Q) -> bool:
+    """
+    Проверка наличия в целевой функции члена int_0^T(x(t)'*Q*x(t))dt
+    """
+    return bool(abs(Q).max() > 1e-15)
+
+
+def get_formulation(P) -> str:
+    """
+    Формулировка модели для задачи P (P.formulation): 'condensed' --- состояния исключены, терминальные
+    ограничения плотные по всем коэффициентам управления; 'shooting' --- состояния в узлах являются
+    переменными, связанными уравнениями перехода по отрезкам (блочно-разреженная модель, линейная по N).
+    При P.formulation = 'auto' формулировка с состояниями выбирается, когда они нужны для члена x(t)'*Q*x(t)
+    или когда горизонт длинный для неустойчивой системы: коэффициенты сжатых терминальных ограничений
+    растут как exp(alpha*(T - t)), alpha --- наибольшая вещественная часть собственных значений A, и при
+    alpha*T > growth_limit их разброс делает модель плохо обусловленной. Для разреженной A выбирается
+    'condensed': в уравнениях перехода матрицы exp(Ah) плотные
+    """
+    growth_limit = 10.
+    if P.formulation != 'auto':
+        return P.formulation
+    if issparse(P.A):
+        return 'condensed'
+    if has_state_cost(P.Q):
+        return 'shooting'
+
+    return 'shooting' if eigvals(P.A).real.max() * P.T > growth_limit else 'condensed'
+
+
+def build_segment_maps(selections, n: int, r: int):
+    """
+    Матрицы перехода от (X, p) к векторам zeta_k = (X[k], S_k*p_k, 1), k = 0, ..., N-1: zeta = Zx*X + Zp*p + unit
+    :param selections: массив формы (N, order*r, r*order) матриц S_k
+    :return: 1) Zx --- матрица формы (N*size, (N + 1)*n),
+             2) Zp --- матрица формы (N*size, r*N*order),
+             3) unit --- вектор единичных компонент
+    """
+    N = selections.shape[0]
+    order = selections.shape[1] // r
+    size = n + order * r + 1
+
+    state_rows = (arange(N)[:, None] * size + arange(n)).reshape(-1)
+    to_zeta_x = csr_matrix(([1.] * (N * n), (state_rows, arange(N * n))), shape=(N * size, (N + 1) * n))
+    rows = []
+    cols = []
+    values = []
+    local = arange(r * order)
+    for k in range(N):
+        block_rows, block_cols = selections[k].nonzero()
+        rows.append(k * size + n + block_rows)
+        cols.append(((local // order * N + k) * order + local % order)[block_cols])
+        values.append(selections[k][block_rows, block_cols])
+    to_zeta_p = csr_matrix((concatenate(values), (concatenate(rows), concatenate(cols))),
+                           shape=(N * size, r * N * order))
+    unit = zeros(N * size)
+    unit[size - 1::size] = 1.
+
+    return to_zeta_x, to_zeta_p, unit
+
+
+def add_node_states(M: Model, transitions, maps, x0, x: MVar, names: bool = False):
+    """
+    Состояния X[k] = x(t_k), k = 0, ..., N, как переменные: X[0] = x0 и X[k + 1] = transitions[k]*zeta_k.
+    Уравнения перехода блочно-двухдиагональные, поэтому матрица ограничений линейна по N.
+    x0 входит только в правую часть ограничения X[0] = x0, поэтому при изменении x0 меняются лишь его границы
+    :return: 1) X --- переменные формы ((N + 1)*n,), 2) initial --- ограничение X[0] = x0
+    """
+    N, n, _ = transitions.shape
+    to_zeta_x, to_zeta_p, unit = maps
+
+    X = M.addMVar((N + 1) * n, lb=-COPT.INFINITY, vtype=COPT.CONTINUOUS, nameprefix=get_name('X', names))
+    initial = M.addConstr(X[:n] == array(x0, dtype=float), name=get_name('initial_state_constraint', names))
+
+    propagation = block_diag(list(transitions), format='csr')
+    M.addConstr(X[n:] - (propagation @ to_zeta_x) @ X - (propagation @ to_zeta_p) @ x == propagation.dot(unit),
+                name=get_name('state_transition_constraint', names))
+
+    return X, initial
+
+
+def add_state_cost(M: Model, factors, maps, X: MVar, x: MVar, names: bool = False):
+    """
+    Член int_0^T(x(t)'*Q*x(t))dt одной суммой квадратов z'z с z = F_k*zeta_k, где F_k'F_k --- малоранговое
+    разложение матриц Грама отрезков. Без состояний в узлах подстановка x(t_k) через все предыдущие
+    отрезки дала бы плотный блок из O(N^2) элементов
+    :return: квадратичное выражение для целевой функции
+    """
+    to_zeta_x, to_zeta_p, unit = maps
+
+    # Нулевые строки разложений (после ранга) отбрасываются
+    factor = block_diag(list(factors), format='csr')
+    factor = factor[factor.getnnz(axis=1) > 0]
+    z = M.addMVar(factor.shape[0], lb=-COPT.INFINITY, vtype=COPT.CONTINUOUS, nameprefix=get_name('z', names))
+    M.addConstr(z - (factor @ to_zeta_x) @ X - (factor @ to_zeta_p) @ x == factor.dot(unit),
+                name=get_name('state_cost_constraint', names))
+
+    return z @ z
+
+
+def add_state_terms(M: Model, P, order: int, x: MVar, formulation: str, names: bool = False):
+    """
+    Состояния в узлах и член int_0^T(x(t)'*Q*x(t))dt, если они нужны формулировке или целевой функции
+    :return: 1) X --- состояния в узлах (None, если не введены),
+             2) state_cost --- квадратичное выражение (None без члена с Q),
+             3) initial --- ограничение X[0] = x0 (None без состояний в узлах)
+    """
+    state_cost = has_state_cost(P.Q)
+    if formulation == 'condensed' and not state_cost:
+        return None, None, None
+
+    transitions, factors, selections = calculate_state_cost_blocks(P.A, P.B, P.C, P.Q if state_cost else None,
+                                                                   P.get_nodes(), order, basis=P.basis)
+    maps = build_segment_maps(selections, P.n, P.r)
+    X, initial = add_node_states(M, transitions, maps, P.x0, x, names)
+
+    return X, add_state_cost(M, factors, maps, X, x, names) if state_cost else None, initial
+
+
+def add_terminal_state_constraints(M: Model, H, g, X: MVar, n: int, names: bool = False):
+    """
+    Терминальные ограничения H*X[N] = g по состоянию в последнем узле
+    """
+    return M.addConstr(H @ X[X.shape[0] - n:] == array(g, dtype=float), name=get_name('terminal_constraint', names))
+
+
+def record_model(M: Model) -> None:
+    """
+    Размеры построенной модели в телеметрии
+    """
+    if is_enabled():
+        count('variables', M.getAttr(COPT.Attr.Cols))
+        count('constraints', M.getAttr(COPT.Attr.Rows))
+        count('cones', M.getAttr(COPT.Attr.Cones))
+
+
+def solve_model(M: Model, terminal: MConstr = None) -> None:
+    """
+    Решение модели с записью статистики решателя в телеметрию (статус, итерации, время, пиковая память
+    и невязка терминальных ограничений) и значения целевой функции в журнал
+    """
+    with stage('solve'):
+        M.solve()
+
+    optimal = M.status == COPT.OPTIMAL
+    if is_enabled():
+        statistics = {
+            'solver': 'copt',
+            'status': M.status,
+            'objective': M.objval if optimal else None,
+            'barrier_iterations': M.getAttr(COPT.Attr.BarrierIter),
+            'simplex_iterations': M.getAttr(COPT.Attr.SimplexIter),
+            'solving_time': M.getAttr(COPT.Attr.SolvingTime),
+            'memory_peak': M.getAttr(COPT.Attr.MemPeak),
+        }
+        if terminal is not None and optimal:
+            activity = array(terminal.getInfo(COPT.Info.Slack).tolist())
+            bound = array(terminal.getInfo(COPT.Info.LB).tolist())
+            statistics['primal_residual'] = float(np_abs(activity - bound).max()) if activity.size else 0.
+        record_solve(statistics)
+
+    if optimal:
+        logger.info('Objective value: %s', M.objval)
+    else:
+        logger.warning('Solver status: %s', M.status)
@@ -0,0 +1,141 @@
+from problem.ProblemStatement import Problem
+from numerical.MatrixExponential import calculate_free_movement, calculate_segment_movement
+from control.MatrixModel import get_values, get_formulation, solve_model
+from control.PiecewiseConstantControl import build_piecewise_constant_model
+from control.PiecewiseLinearControl import build_piecewise_linear_model
+from control.QuadraticSplineControl import build_quadratic_spline_model
+from control.SplineControl import get_spline_builder, get_title
+from control.PiecewisePolynomialControl import PiecewisePolynomialControl
+from control.Sensitivity import SolutionSensitivity
+from control.SolverProfiles import apply_profile
+from numpy import array, empty
+from coptpy import Envr, COPT
+from copy import copy
+
+
+# Режим управления: (построение модели, количество коэффициентов на отрезке, название модели)
+MODES = {
+    'constant': (build_piecewise_constant_model, 1, 'Optimal Piecewise Constant Control Searching'),
+    'linear': (build_piecewise_linear_model, 2, 'Optimal Piecewise Linear Control Searching'),
+    'quadratic': (build_quadratic_spline_model, 3, 'Optimal Quadratic Spline Control Searching'),
+    'cubic': (get_spline_builder(3), 4, get_title(3)),
+}
+
+
+def get_mode(mode: str):
+    if mode not in MODES:
+        raise ValueError('Unknown control mode: {}'.format(mode))
+
+    return MODES[mode]
+
+
+class ParametricController(object):
+
+    def __init__(self, P: Problem, mode: str = 'quadratic', env: Envr = None, names: bool = False,
+                 parameters: dict = None) -> None:
+        """
+        Модель оптимизации строится один раз; x0 и g входят в задачу только через правую часть
+        терминальных ограничений h = g - H*xT, поэтому при их изменении обновляется только она.
+        Состояния в узлах (в формулировке с ними или для члена x(t)'*Q*x(t)) связаны с x0 только правой частью
+        ограничения X[0] = x0: член с Q выражен через X, поэтому коэффициенты целевой функции от x0
+        не зависят, и обновляются только границы этого ограничения
+        :param env: окружение решателя (создаётся, если не задано)
+        :param parameters: параметры решателя, заменяющие профиль режима (см. SolverProfiles)
+        """
+        build, self.order, self.title = get_mode(mode)
+
+        self.P = copy(P)
+        self.mode = mode
+        self.names = names
+        self.env = Envr() if env is None else env
+        self.build = build
+        self.parameters = parameters
+        self.M = self.create_model()
+        self.constraints = {}
+        self.x, self.terminal = build(self.M, self.P, names, constraints=self.constraints)
+        self.formulation = get_formulation(self.P)
+        self.values = None
+
+    def create_model(self):
+        M = self.env.createModel(self.title)
+        apply_profile(M, self.mode, self.parameters)
+
+        return M
+
+    def update(self, x0=None, g=None) -> None:
+        """
+        Изменение начального состояния и/или терминальной цели без перестроения модели
+        """
+        if x0 is not None:
+            self.P.x0 = array(x0, dtype=float)
+        if g is not None:
+            self.P.g = array(g, dtype=float)
+
+        initial = self.constraints.get('initial')
+        if x0 is not None and initial is not None:
+            initial.setInfo(COPT.Info.LB, self.P.x0)
+            initial.setInfo(COPT.Info.UB, self.P.x0)
+
+        if self.formulation == 'shooting':
+            h = self.P.g
+        else:
+            h = self.P.g - self.P.H.dot(calculate_free_movement(self.P.A, self.P.C, self.P.x0, self.P.T))
+        self.terminal.setInfo(COPT.Info.LB, h)
+        self.terminal.setInfo(COPT.Info.UB, h)
+
+    def solve(self):
+        """
+        Решение текущей задачи. Решатель сохраняет базис предыдущего решения в модели,
+        поэтому повторные решения задач ЛП начинаются с него
+        :return: коэффициенты управления, массив формы (r, N, order), или None, если оптимальное решение
+                 не найдено (статус --- self.M.status)
+        """
+        solve_model(self.M, self.terminal)
+        # Без оптимального решения значения переменных у решателя недоступны
+        if self.M.status != COPT.OPTIMAL:
+            self.values = None
+
+            return None
+        self.values = get_values(self.x).reshape(self.P.r, self.P.N, self.order)
+
+        return self.values
+
+    def get_sensitivity(self) -> SolutionSensitivity:
+        """
+        Двойственные оценки и чувствительность последнего решения к x0 и g (см. SolutionSensitivity):
+        по прогнозу можно решить, нужно ли для новых x0 и g обращаться к решателю
+        """
+        return SolutionSensitivity(self.M, self.x, self.terminal, self.P, self.order)
+
+
+def run_receding_horizon(P: Problem, mode: str = 'quadratic', steps: int = None, env: Envr = None):
+    """
+    Управление со скользящим горизонтом: на каждом шаге задача на отрезке [0, T] решается из текущего
+    состояния, к системе применяется управление первого отрезка [t_0, t_1], после чего горизонт сдвигается.
+    Система стационарна, поэтому при сдвиге меняется только x0, и модель не перестраивается
+    :param steps: количество шагов (по умолчанию N)
+    :return: 1) x_grid --- состояния в начале каждого шага, массив формы (steps + 1, n),
+             2) applied --- применённые коэффициенты управления, массив формы (steps, r, order)
+    """
+    if steps is None:
+        steps = P.N
+    nodes = P.get_nodes()
+    h = nodes[1] - nodes[0]
+
+    controller = ParametricController(P, mode, env)
+
+    x_grid = empty((steps + 1, P.n))
+    applied = empty((steps, P.r, controller.order))
+    x_grid[0] = P.x0
+    for step in range(steps):
+        if step > 0:
+            controller.update(x0=x_grid[step])
+        values = controller.solve()
+        if values is None:
+            raise ValueError('No optimal control at step {} (solver status {})'.format(step, controller.M.status))
+
+        # Коэффициенты первого отрезка по степеням времени, отсчитываемого от его начала
+        applied[step] = PiecewisePolynomialControl(values, nodes, P.basis).get_local_coefficients()[:, 0, :]
+        x_grid[step + 1] = calculate_segment_movement(P.A, P.B, P.C, x_grid[step], applied[step], h)
+
+    return x_grid, applied
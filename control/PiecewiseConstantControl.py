@@ -1,99 +1,180 @@
 from problem.ProblemStatement import Problem
-from numerical.DifferentialEquation import solve_linear_differential_equation
-from numerical.Interpolation import interpolate
-from numerical.DefiniteIntegral import integrate
-from numpy import linspace
-from coptpy import Envr, Model, tuplelist, quicksum, COPT, LinExpr
-
-
-def add_control_vars(M: Model, r: int, N: int, L1: list, L2: list):
-    u_indices = tuplelist()
-    lb = {}
-    ub = {}
-    for j in range(r):
-        for k in range(N):
-            u_indices.append((j, k))
-            lb[j, k] = L1[j]
-            ub[j, k] = L2[j]
-    u = M.addVars(u_indices, vtype=COPT.CONTINUOUS, lb=lb, ub=ub, nameprefix='u')
+from numerical.TerminalCoefficients import calculate_terminal_projections
+from numerical.BoxQuadraticProgramming import solve_separable_box_qp
+from control.MatrixModel import get_name, get_values, build_quadratic_matrix, add_terminal_constraints_matrix, \
+    has_state_cost, get_formulation, add_state_terms, add_terminal_state_constraints, record_model, solve_model
+from control.Sensitivity import SolutionSensitivity
+from control.SolverProfiles import apply_profile
+from instrumentation.Telemetry import stage, record_solve
+from numpy import array, repeat, zeros, arange, diag, diff, kron, concatenate, abs as np_abs
+from scipy.sparse import csr_matrix
+from coptpy import Envr, Model, MVar, COPT
+import logging
 
-    return u
+
+logger = logging.getLogger(__name__)
 
 
-def add_terminal_constraints(M: Model, A, B, C, H, x0, g, T, N, r, m, u):
-    grid_size = 501
-    straight_grid = linspace(0, T, grid_size)
-    reverse_grid = linspace(T, 0, grid_size)
+def add_control_vars(M: Model, r: int, N: int, L1: list, L2: list, names: bool = False):
+    # Переменные u[i, k] в порядке i*N + k
+    u = M.addMVar(r * N, lb=repeat(L1, N), ub=repeat(L2, N), vtype=COPT.CONTINUOUS, nameprefix=get_name('u', names))
 
-    z_0 = solve_linear_differential_equation(A, x0, straight_grid)
+    return u
 
-    zc = solve_linear_differential_equation(-A, C, reverse_grid)
-    spline_zc = interpolate(reverse_grid, zc)
-    int_zc = integrate(spline_zc, 0, T)
 
-    # Решение уравнения при нулевом управлении: dx/dt = Ax + C в точке T
-    xT = z_0[-1, :] + int_zc
-    h = g - H.dot(xT)
+def add_terminal_constraints(M: Model, A, B, C, H, c, x0, g, nodes, r, m, u: MVar, method='expm', names=False,
+                             basis='global'):
+    # Проекции на строки H и c решения уравнения dx/dt = Ax + C при нулевом управлении в точке T
+    # и выражений int_(t_k)^(t_(k+1)) (exp(A(T-t))b_i) dt (при постоянном управлении оба базиса совпадают;
+    # базис задачи передаётся, чтобы предвычисления находились в кэше по тому же ключу, что и у сплайнов)
+    HxT, HD, cD = calculate_terminal_projections(A, B, C, x0, H, c, nodes, 1, method, basis=basis)
 
-    a_new = {l: {} for l in range(m)}
-    D = {}
-    for i in range(r):
-        zb = solve_linear_differential_equation(-A, B[:, i], reverse_grid)
-        spline_zb = interpolate(reverse_grid, zb)
-        for k in range(N):
-            # Выражение int_(Tk/N)^(T(k+1)/N) (exp(A(T-t))b_i) dt
-            D[i, k] = integrate(spline_zb, T*k/N, T*(k+1)/N)
-            a_new_ik = H.dot(D[i, k])
-            for l in range(m):
-                a_new[l][i, k] = a_new_ik[l]
+    h = g - HxT
+    terminal = add_terminal_constraints_matrix(M, HD, h, u, names)
 
-    M.addConstrs((u.prod(a_new[l]) == h[l] for l in range(m)), nameprefix='terminal_constraint')
+    return cD, terminal
 
-    return D
 
+def add_objective(M: Model, R, d, L1, L2, r, nodes, cx, u: MVar, names=False, state_cost=None):
+    N = len(nodes) - 1
+    widths = diff(nodes)
 
-def add_objective(M: Model, R, d, c, L1, L2, r, N, T, D, u):
     # Выражение int_0^T(u(t)'*R*u(t))dt
-    quadratic_u = quicksum(T/N * R[i1, i2] * u[i1, k] * u[i2, k]
-                           for i1 in range(r) for i2 in range(r)
-                           for k in range(N) if abs(R[i1, i2]) > 1e-15)
+    quadratic_u = u @ (build_quadratic_matrix(R, nodes, 1) @ u)
 
-    # Выражение int_0^T(d*|u(t)|)dt
-    abs_u = LinExpr(0)
-    v = {}
+    # Выражение int_0^T(d*|u(t)|)dt: при знакопостоянном u_i модуль раскрывается сразу,
+    # иначе u_i = v2 - v1 с неотрицательными v1, v2
+    linear_u = zeros(r * N)
+    split = []
     for i in range(r):
         if abs(d[i]) > 1e-15:
             if L1[i] > -1e-15:
-                abs_u += T/N * d[i] * u.sum(i, '*')
+                linear_u[i * N:(i + 1) * N] += widths * d[i]
             elif L2[i] < 1e-15:
-                abs_u += -T/N * d[i] * u.sum(i, '*')
+                linear_u[i * N:(i + 1) * N] += -widths * d[i]
             else:
-                for k in range(N):
-                    v[i, k, 1] = M.addVar(vtype=COPT.CONTINUOUS, lb=0, ub=-L1[i], name='v[{}, {}, 1]'.format(i, k))
-                    v[i, k, 2] = M.addVar(vtype=COPT.CONTINUOUS, lb=0, ub=L2[i], name='v[{}, {}, 2]'.format(i, k))
-                    M.addConstr(u[i, k] == v[i, k, 2] - v[i, k, 1], 'abs_split_constraint_{}_{}'.format(i, k))
-                abs_u += T/N * d[i] * quicksum((v[i, k, 1] + v[i, k, 2]) for k in range(N))
-
-    # Выражение c*x(T) (без свободного члена)
-    cD = {key: c.dot(val) for key, val in D.items()}
-    cx = u.prod(cD)
+                split.append(i)
+
+    objective = quadratic_u + linear_u @ u
+    if split:
+        size = len(split) * N
+        v1 = M.addMVar(size, lb=0., ub=repeat([-L1[i] for i in split], N), vtype=COPT.CONTINUOUS,
+                       nameprefix=get_name('v1', names))
+        v2 = M.addMVar(size, lb=0., ub=repeat([L2[i] for i in split], N), vtype=COPT.CONTINUOUS,
+                       nameprefix=get_name('v2', names))
+        rows = arange(size)
+        cols = array([i * N + k for i in split for k in range(N)])
+        selection = csr_matrix(([1.] * size, (rows, cols)), shape=(size, r * N))
+        M.addConstr(selection @ u - v2 + v1 == zeros(size), name=get_name('abs_split_constraint', names))
+
+        weights = concatenate([widths * d[i] for i in split])
+        objective = objective + weights @ v1 + weights @ v2
+
+    # Выражение c*x(T) (в сжатой формулировке без свободного члена)
+    objective = objective + cx
+
+    # Выражение int_0^T(x(t)'*Q*x(t))dt
+    if state_cost is not None:
+        objective = objective + state_cost
 
     # Задание целевой функции
-    M.setObjective(quadratic_u + abs_u + cx, sense=COPT.MINIMIZE)
-
+    M.setObjective(objective, sense=COPT.MINIMIZE)
+
+
+def build_piecewise_constant_model(M: Model, P: Problem, names: bool = False, constraints: dict = None):
+    """
+    :param constraints: словарь для ограничения начального состояния (см. build_spline_model)
+    """
+    with stage('build'):
+        u = add_control_vars(M, P.r, P.N, P.L1, P.L2, names)
+
+        nodes = P.get_nodes()
+        formulation = get_formulation(P)
+        X, state_cost, initial = add_state_terms(M, P, 1, u, formulation, names)
+        if formulation == 'shooting':
+            terminal = add_terminal_state_constraints(M, P.H, P.g, X, P.n, names)
+            cx = P.c @ X[P.N * P.n:]
+        else:
+            cD, terminal = add_terminal_constraints(M, P.A, P.B, P.C, P.H, P.c, P.x0, P.g, nodes, P.r, P.m, u,
+                                                    names=names, basis=P.basis)
+            cx = cD.reshape(-1) @ u
+
+        add_objective(M, P.R, P.d, P.L1, P.L2, P.r, nodes, cx, u, names, state_cost)
+
+    record_model(M)
+    if constraints is not None:
+        constraints['initial'] = initial
+
+    return u, terminal
+
+
+def is_native_supported(P: Problem) -> bool:
+    """
+    Проверка применимости собственного решателя: без членов d*|u(t)| и x(t)'*Q*x(t) и с диагональной
+    положительно определённой матрицей R задача сводится к сепарабельной квадратичной задаче с ограничениями-брусом
+    """
+    R = array(P.R, dtype=float)
+
+    return bool(np_abs(P.d).max() <= 1e-15 and not has_state_cost(P.Q) and
+                np_abs(R - diag(diag(R))).max() <= 1e-15 and diag(R).min() > 0)
+
+
+def solve_piecewise_constant_control_natively(P: Problem, multipliers=None):
+    """
+    Решение задачи без COPT полугладким методом Ньютона для двойственной задачи с m переменными
+    :param multipliers: начальное приближение множителей терминальных ограничений
+    :return: 1) u --- значения управления на отрезках в порядке i*N + k,
+             2) multipliers --- множители Лагранжа терминальных ограничений,
+             3) objective --- значение целевой функции (без свободного члена),
+             4) converged --- признак сходимости
+    """
+    nodes = P.get_nodes()
+    HxT, HD, cD = calculate_terminal_projections(P.A, P.B, P.C, P.x0, P.H, P.c, nodes, 1)
+    h = P.g - HxT
+    G = HD.reshape(-1, P.m).T
+
+    # Выражения int_0^T(u(t)'*R*u(t))dt и c*x(T) (без свободного члена)
+    a = kron(diag(array(P.R, dtype=float)), diff(nodes))
+    q = cD.reshape(-1)
+
+    u, multipliers, converged = solve_separable_box_qp(a, q, G, h, repeat(P.L1, P.N), repeat(P.L2, P.N), multipliers)
+
+    return u, multipliers, (a * u * u + q * u).sum(), converged
+
+
+def search_piecewise_constant_control(P: Problem, names: bool = False, backend: str = 'copt',
+                                      sensitivity: bool = False, parameters: dict = None):
+    """
+    Поиск оптимального кусочно-постоянного управления
+    :param backend: 'copt' --- решение COPT, 'native' --- собственный решатель, если он применим к задаче
+                    (иначе, а также при отсутствии сходимости, задача решается COPT)
+    :param sensitivity: вернуть также двойственные оценки и чувствительность решения к x0 и g
+                        (см. SolutionSensitivity; задача в этом случае решается COPT)
+    :param parameters: параметры решателя, заменяющие профиль режима (см. SolverProfiles)
+    """
+    if backend not in ('copt', 'native'):
+        raise ValueError('Unknown backend {}'.format(backend))
+
+    if backend == 'native' and not sensitivity and is_native_supported(P):
+        with stage('solve'):
+            u, _, objective, converged = solve_piecewise_constant_control_natively(P)
+        record_solve({'solver': 'native', 'converged': converged, 'objective': objective})
+        if converged:
+            logger.info('Objective value: %s', objective)
+
+            return u.reshape(P.r, P.N, 1)
 
-def search_piecewise_constant_control(P: Problem):
     env = Envr()
     M: Model = env.createModel('Optimal Piecewise Constant Control Searching')
+    apply_profile(M, 'constant', parameters)
 
-    u = add_control_vars(M, P.r, P.N, P.L1, P.L2)
-
-    D = add_terminal_constraints(M, P.A, P.B, P.C, P.H, P.x0, P.g, P.T, P.N, P.r, P.m, u)
-
-    add_objective(M, P.R, P.d, P.c, P.L1, P.L2, P.r, P.N, P.T, D, u)
+    u, terminal = build_piecewise_constant_model(M, P, names)
 
-    M.solve()
+    solve_model(M, terminal)
 
-    print(M.getObjective().getValue())
+    # Коэффициенты управления одним массивом формы (r, N, 1)
+    values = get_values(u).reshape(P.r, P.N, 1)
+    if sensitivity:
+        return values, SolutionSensitivity(M, u, terminal, P, 1)
 
-    return {key: val.X for key, val in u.items()}
+    return values
@@ -0,0 +1,121 @@
+from numerical.MatrixExponential import calculate_shift_weights
+from numpy import asarray, zeros, searchsorted, clip, arange, concatenate, cumsum, diff, einsum
+
+
+def evaluate_polynomials(coefficients, t):
+    """
+    Значения полиномов sum_o coefficients[..., o]*t^o по схеме Горнера
+    """
+    order = coefficients.shape[-1]
+    values = coefficients[..., order - 1]
+    for o in reversed(range(order - 1)):
+        values = values * t + coefficients[..., o]
+
+    return values
+
+
+class PiecewisePolynomialControl(object):
+
+    def __init__(self, coefficients, nodes, basis: str = 'global') -> None:
+        """
+        Кусочно-полиномиальное управление u_i(t) = sum_o coefficients[i, k, o]*t^o на отрезках [nodes[k], nodes[k+1]]
+        (для basis = 'local' --- sum_o coefficients[i, k, o]*tau^o, tau = (t - nodes[k])/(nodes[k+1] - nodes[k]))
+        :param coefficients: массив формы (r, N, degree + 1)
+        :param nodes: возрастающий массив узлов длины N + 1
+        """
+        self.coefficients = asarray(coefficients, dtype=float)
+        self.nodes = asarray(nodes, dtype=float)
+        self.basis = basis
+        self.r, self.N, self.order = self.coefficients.shape
+        self.widths = diff(self.nodes)
+
+    def get_segments(self, t):
+        """
+        Номера отрезков для моментов t; моменты вне [nodes[0], nodes[-1]] относятся к крайним отрезкам.
+        Момент, совпадающий с узлом с точностью до ошибок округления, относится к отрезку справа от узла
+        """
+        tolerance = 1e-12 * (self.nodes[-1] - self.nodes[0])
+
+        return clip(searchsorted(self.nodes, t + tolerance, side='right') - 1, 0, self.N - 1)
+
+    def get_arguments(self, t, segments):
+        """
+        Аргументы полиномов отрезков segments в моменты t
+        """
+        if self.basis == 'local':
+            return (t - self.nodes[segments]) / self.widths[segments]
+
+        return t
+
+    def get_end_values(self, coefficients=None):
+        """
+        Значения полиномов в левых и правых концах отрезков
+        :return: два массива формы (r, N)
+        """
+        if coefficients is None:
+            coefficients = self.coefficients
+        if self.basis == 'local':
+            return coefficients[..., 0], coefficients.sum(axis=-1)
+
+        return evaluate_polynomials(coefficients, self.nodes[:-1]), evaluate_polynomials(coefficients, self.nodes[1:])
+
+    def get_local_coefficients(self):
+        """
+        Коэффициенты полиномов по степеням s = t - nodes[k] на каждом отрезке, массив формы (r, N, order)
+        """
+        if self.basis == 'local':
+            return self.coefficients * self.widths[:, None] ** -arange(self.order, dtype=float)
+
+        return einsum('iko,koj->ikj', self.coefficients, calculate_shift_weights(self.nodes[:-1], self.order))
+
+    def __call__(self, t):
+        """
+        Значения управления
+        :return: массив формы (r,) для скалярного t или t.shape + (r,) для массива
+        """
+        t = asarray(t, dtype=float)
+        t_flat = t.reshape(-1)
+        segments = self.get_segments(t_flat)
+
+        values = evaluate_polynomials(self.coefficients[:, segments, :], self.get_arguments(t_flat, segments))
+
+        return values.T.reshape(t.shape + (self.r,))
+
+    def derivative(self, order: int = 1):
+        """
+        Производная управления порядка order
+        """
+        coefficients = self.coefficients
+        for _ in range(order):
+            if coefficients.shape[2] == 1:
+                coefficients = zeros(coefficients.shape)
+            else:
+                coefficients = coefficients[:, :, 1:] * arange(1, coefficients.shape[2])
+                if self.basis == 'local':
+                    coefficients = coefficients / self.widths[:, None]
+
+        return PiecewisePolynomialControl(coefficients, self.nodes, self.basis)
+
+    def antiderivative(self):
+        """
+        Первообразная F(t) = int_(nodes[0])^t (u(s)) ds, непрерывная на всём отрезке управления
+        """
+        coefficients = zeros((self.r, self.N, self.order + 1))
+        coefficients[:, :, 1:] = self.coefficients / arange(1, self.order + 1)
+        if self.basis == 'local':
+            coefficients = coefficients * self.widths[:, None]
+
+        # Свободные члены на отрезках обеспечивают непрерывность и F(nodes[0]) = 0
+        left, right = self.get_end_values(coefficients)
+        accumulated = concatenate((zeros((self.r, 1)), cumsum(right - left, axis=1)[:, :-1]), axis=1)
+        coefficients[:, :, 0] = accumulated - left
+
+        return PiecewisePolynomialControl(coefficients, self.nodes, self.basis)
+
+    def integrate(self, t_start: float, t_finish: float):
+        """
+        Выражение int_(t_start)^(t_finish) (u(t)) dt
+        """
+        antiderivative = self.antiderivative()
+
+        return antiderivative(t_finish) - antiderivative(t_start)
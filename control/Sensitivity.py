@@ -0,0 +1,291 @@
+from problem.ProblemStatement import Problem
+from numerical.MatrixExponential import calculate_shift_weights
+from control.MatrixModel import has_state_cost, get_formulation
+from numpy import array, zeros, asarray, concatenate, isfinite, where, searchsorted, inf, arange, diff, \
+    abs as np_abs
+from numpy.linalg import lstsq
+from scipy.linalg import expm
+from scipy.sparse import issparse, csr_matrix, vstack, bmat, identity
+from scipy.sparse.linalg import expm_multiply
+from coptpy import Model, MVar, MConstr, COPT
+
+
+def calculate_terminal_maps(P: Problem):
+    """
+    Производные правой части терминальных ограничений h = g - H*xT и члена c*xT по x0:
+    xT = exp(AT)*x0 + ..., поэтому dh/dx0 = -H*exp(AT) и d(c*xT)/dx0 = c*exp(AT)
+    (для разреженной A --- действием exp(A'T) на строки H и c)
+    :return: 1) HPhi --- массив формы (m, n), 2) cPhi --- вектор формы (n,)
+    """
+    H = P.H.toarray() if issparse(P.H) else asarray(P.H, dtype=float)
+    W = concatenate((H, asarray(P.c, dtype=float)[None]))
+    if issparse(P.A):
+        WPhi = expm_multiply(csr_matrix(P.A).T * P.T, W.T).T
+    else:
+        WPhi = W.dot(expm(asarray(P.A, dtype=float) * P.T))
+
+    return WPhi[:-1], WPhi[-1]
+
+
+def get_quadratic_objective(M: Model):
+    """
+    Матрица и вектор целевой функции 1/2*y'*G*y + q'*y модели по всем её переменным
+    """
+    size = M.getAttr(COPT.Attr.Cols)
+    objective = M.getObjective()
+    q = zeros(size)
+    rows = []
+    cols = []
+    values = []
+    if isinstance(objective, (int, float)):
+        return csr_matrix((size, size)), q
+
+    linear = objective.getLinExpr() if hasattr(objective, 'getLinExpr') else objective
+    for j in range(linear.getSize()):
+        q[linear.getVar(j).index] += linear.getCoeff(j)
+    if hasattr(objective, 'getVar1'):
+        for j in range(objective.getSize()):
+            first = objective.getVar1(j).index
+            second = objective.getVar2(j).index
+            coefficient = objective.getCoeff(j)
+            rows += [first, second]
+            cols += [second, first]
+            values += [coefficient, coefficient]
+
+    return csr_matrix((values, (rows, cols)), shape=(size, size)), q
+
+
+class SolutionSensitivity(object):
+
+    def __init__(self, M: Model, x: MVar, terminal: MConstr, P: Problem, order: int, tolerance: float = 1e-7) -> None:
+        """
+        Двойственные оценки и активное множество решённой модели и чувствительность решения к x0 и g.
+        x0 и g входят в сжатую формулировку только через правую часть h терминальных ограничений. Пока активное
+        множество не меняется, решение задачи КП --- линейная функция h: из системы Каруша-Куна-Таккера
+        G*y + q - J'*lambda = 0, J*y = b по активным строкам J один раз вычисляется отклик (dy, dlambda)
+        на единичные изменения h (решение наименьшей нормы, так что зависимые активные строки допустимы),
+        после чего прогноз для нового x0 или g --- умножение матрицы на вектор
+        :param x: переменные коэффициентов управления
+        :param terminal: терминальные ограничения
+        :param tolerance: относительный допуск активности ограничения
+        """
+        if has_state_cost(P.Q) or get_formulation(P) == 'shooting':
+            raise ValueError('Sensitivity is available for the condensed formulation without the x\'Qx term')
+        if M.status != COPT.OPTIMAL:
+            raise ValueError('Model is not solved to optimality (status {})'.format(M.status))
+
+        self.P = P
+        self.x0 = array(P.x0, dtype=float)
+        self.g = array(P.g, dtype=float)
+        self.order = order
+        self.objective = M.objval
+        self.columns = array([var.index for var in x.tolist()])
+        self.terminal_rows = array([constraint.index for constraint in terminal.tolist()])
+
+        constraints = M.getConstrs()
+        variables = M.getVars()
+        self.y = array(M.getValues())
+        self.duals = array(M.getDuals())
+        self.reduced_costs = array(M.getRedcosts())
+        self.matrix = csr_matrix(M.getA())
+        self.activity = self.matrix.dot(self.y)
+        self.row_bounds = array(M.getInfo(COPT.Info.LB, constraints)), array(M.getInfo(COPT.Info.UB, constraints))
+        self.variable_bounds = array(M.getInfo(COPT.Info.LB, variables)), array(M.getInfo(COPT.Info.UB, variables))
+        self.terminal_duals = self.duals[self.terminal_rows]
+        self.hessian, _ = get_quadratic_objective(M)
+        self.tolerance = tolerance
+
+        # Активные границы строк и переменных (строки-равенства --- отдельно)
+        lower, upper = self.row_bounds
+        self.equality_rows = isfinite(lower) & (lower == upper)
+        self.lower_rows, self.upper_rows = self.get_active(self.activity, lower, upper, tolerance)
+        self.lower_rows &= ~self.equality_rows
+        self.upper_rows &= ~self.equality_rows
+        lower, upper = self.variable_bounds
+        self.lower_variables, self.upper_variables = self.get_active(self.y, lower, upper, tolerance)
+        fixed = isfinite(lower) & (lower == upper)
+        self.lower_variables &= ~fixed
+        self.upper_variables &= ~fixed
+        self.fixed_variables = fixed
+
+        self.HPhi, self.cPhi = calculate_terminal_maps(P)
+        self.response = self.calculate_response()
+
+    @staticmethod
+    def get_active(values, lower, upper, tolerance: float):
+        scale = tolerance * (1. + np_abs(values))
+
+        return (isfinite(lower) & (values - lower <= scale)), (isfinite(upper) & (upper - values <= scale))
+
+    def get_active_set(self) -> dict:
+        """
+        :return: словарь масок активных ограничений: lower_rows, upper_rows, lower_variables, upper_variables
+        """
+        return {'lower_rows': self.lower_rows, 'upper_rows': self.upper_rows,
+                'lower_variables': self.lower_variables, 'upper_variables': self.upper_variables}
+
+    def get_basis_transform(self):
+        """
+        Замена переменных y = S*z, в которой коэффициенты управления z --- коэффициенты в базисе 'local'
+        (прочие переменные не меняются): в базисе 'global' столбцы мономов t^o на далёких от нуля отрезках
+        почти линейно зависимы, и система Каруша-Куна-Таккера в них плохо обусловлена.
+        ((t - t_k)/h_k)^j = h_k^(-j)*sum_o C(j, o)*(-t_k)^(j-o)*t^o
+        """
+        size = len(self.y)
+        if self.P.basis == 'local' or self.order == 1:
+            return identity(size, format='csr')
+
+        nodes = self.P.get_nodes()
+        # weights[k, j, o] --- коэффициент при t^o функции ((t - t_k)/h_k)^j
+        weights = calculate_shift_weights(-nodes[:-1], self.order) * \
+            (diff(nodes)[:, None] ** -arange(self.order, dtype=float))[:, :, None]
+        columns = self.columns.reshape(self.P.r, self.P.N, self.order)
+        rows = columns[:, :, None, :].repeat(self.order, axis=2)
+        cols = columns[:, :, :, None].repeat(self.order, axis=3)
+        values = weights[None].repeat(self.P.r, axis=0)
+        others = zeros(size, dtype=bool)
+        others[self.columns] = True
+        others = where(~others)[0]
+
+        return csr_matrix((concatenate((values.ravel(), zeros(len(others)) + 1.)),
+                           (concatenate((rows.ravel(), others)), concatenate((cols.ravel(), others)))),
+                          shape=(size, size))
+
+    def calculate_response(self):
+        """
+        Отклик решения и множителей ограничений системы на изменение h: массив формы (size + active, m).
+        В систему входят равенства и активные неравенства с ненулевыми множителями: у слабо активных
+        (с нулевым множителем) ограничений нулевой множитель допустим, и они проверяются как неактивные
+        (см. get_primal_step). Активные строки бывают линейно зависимыми (например, совпадающие условия
+        на коэффициенты Бернштейна в общих концах частей отрезка), поэтому отклик --- решение наименьшей нормы;
+        множители решателя вместе с ним дают множители прогноза (см. get_dual_step).
+        Система решается в переменных базиса 'local' (см. get_basis_transform)
+        """
+        size = len(self.y)
+        scale = self.tolerance * max(1., float(np_abs(self.duals).max(initial=0.)),
+                                     float(np_abs(self.reduced_costs).max(initial=0.)))
+        rows = self.equality_rows | ((self.lower_rows | self.upper_rows) & (np_abs(self.duals) > scale))
+        variables = self.fixed_variables | ((self.lower_variables | self.upper_variables) &
+                                            (np_abs(self.reduced_costs) > scale))
+        self.active_rows = where(rows)[0]
+        self.active_variables = where(variables)[0]
+        self.terminal_positions = size + searchsorted(self.active_rows, self.terminal_rows)
+        J = vstack([self.matrix[self.active_rows], identity(size, format='csr')[self.active_variables]])
+        self.system = bmat([[self.hessian, -J.T], [J, None]], format='csr')
+
+        S = self.get_basis_transform()
+        JS = J.dot(S)
+        K = bmat([[S.T.dot(self.hessian).dot(S), -JS.T], [JS, None]]).toarray()
+        right = zeros((len(K), len(self.terminal_rows)))
+        right[self.terminal_positions, range(len(self.terminal_rows))] = 1.
+        response = lstsq(K, right, rcond=None)[0]
+        response[:size] = S.dot(response[:size])
+
+        return response
+
+    def get_terminal_change(self, x0=None, g=None):
+        dh = zeros(len(self.terminal_rows))
+        if x0 is not None:
+            dh -= self.HPhi.dot(asarray(x0, dtype=float) - self.x0)
+        if g is not None:
+            dh += asarray(g, dtype=float) - self.g
+
+        return dh
+
+    def get_cost_gradients(self):
+        """
+        Первые производные оптимального значения целевой функции (с членом c*xT) по x0 и g
+        :return: 1) dJ/dx0 --- вектор формы (n,), 2) dJ/dg --- вектор формы (m,)
+        """
+        return self.cPhi - self.HPhi.T.dot(self.terminal_duals), self.terminal_duals.copy()
+
+    def predict(self, x0=None, g=None):
+        """
+        Прогноз решения при новых x0 и/или g без обращения к решателю
+        :return: 1) коэффициенты управления, массив формы (r, N, order),
+                 2) словарь оценки: step --- доля изменения, на которой активное множество не меняется
+                    (при step >= 1 прогноз точен с точностью до округления), residual --- относительная невязка
+                    условий Каруша-Куна-Таккера прогноза при этом активном множестве, resolve --- признак
+                    необходимости полного решения (step < 1 или residual больше tolerance), error --- оценка
+                    ошибки коэффициентов max(1 - step, residual/tolerance)*|dy|, objective --- прогноз целевой
+                    функции модели (без члена c*xT)
+        """
+        dh = self.get_terminal_change(x0, g)
+        size = len(self.y)
+        delta = self.response.dot(dh)
+        dy = delta[:size]
+        dlambda = delta[size:]
+        step = min(self.get_primal_step(dy), self.get_dual_step(dlambda))
+        residual = self.get_residual(delta, dh)
+
+        # Оптимальное значение квадратично по h при неизменном активном множестве
+        objective = self.objective + self.terminal_duals.dot(dh) + 0.5 * dh.dot(delta[self.terminal_positions])
+        values = (self.y + dy)[self.columns].reshape(self.P.r, self.P.N, self.order)
+        estimate = {
+            'step': float(step),
+            'residual': residual,
+            'resolve': bool(step < 1. or residual > self.tolerance),
+            'error': max(1. - float(step), residual / self.tolerance, 0.) * float(np_abs(dy).max(initial=0.)),
+            'objective': float(objective),
+        }
+
+        return values, estimate
+
+    def get_residual(self, delta, dh) -> float:
+        """
+        Невязка системы Каруша-Куна-Таккера G*dy - J'*dlambda = 0, J*dy = db для изменения delta,
+        отнесённая к наибольшему слагаемому строк
+        """
+        right = zeros(self.system.shape[0])
+        right[self.terminal_positions] = dh
+        scale = np_abs(self.system).dot(np_abs(delta)) + np_abs(right)
+        if scale.max(initial=0.) == 0.:
+            return 0.
+
+        return float(np_abs(self.system.dot(delta) - right).max() / scale.max())
+
+    def get_primal_step(self, dy) -> float:
+        """
+        Наибольшая доля изменения, при которой ограничения вне системы (неактивные и слабо активные)
+        остаются выполненными с допуском tolerance
+        """
+        kept_rows = zeros(len(self.activity), dtype=bool)
+        kept_rows[self.active_rows] = True
+        kept_variables = zeros(len(self.y), dtype=bool)
+        kept_variables[self.active_variables] = True
+
+        step = inf
+        for values, change, (lower, upper), kept in ((self.activity, self.matrix.dot(dy), self.row_bounds, kept_rows),
+                                                     (self.y, dy, self.variable_bounds, kept_variables)):
+            with_lower = ~kept & isfinite(lower) & (change < 0)
+            with_upper = ~kept & isfinite(upper) & (change > 0)
+            if with_lower.any():
+                bound = lower[with_lower]
+                margin = self.tolerance * (1. + np_abs(bound))
+                step = min(step, ((bound - margin - values[with_lower]) / change[with_lower]).min())
+            if with_upper.any():
+                bound = upper[with_upper]
+                margin = self.tolerance * (1. + np_abs(bound))
+                step = min(step, ((bound + margin - values[with_upper]) / change[with_upper]).min())
+
+        return max(step, 0.)
+
+    def get_dual_step(self, dlambda) -> float:
+        """
+        Наибольшая доля изменения, при которой множители активных неравенств сохраняют знак
+        (неотрицательные у нижних границ, неположительные у верхних)
+        """
+        multipliers = concatenate((self.duals[self.active_rows], self.reduced_costs[self.active_variables]))
+        lower = concatenate((self.lower_rows[self.active_rows], self.lower_variables[self.active_variables]))
+        upper = concatenate((self.upper_rows[self.active_rows], self.upper_variables[self.active_variables]))
+
+        # Ограничения с обеими активными границами (например, L1 = L2) знак не ограничивает
+        sign = where(lower & ~upper, 1., where(upper & ~lower, -1., 0.))
+        decreasing = sign * dlambda < 0
+        if not decreasing.any():
+            return inf
+
+        # Допуск на знак множителей того же порядка, что и допуск активности
+        margin = self.tolerance * max(1., float(np_abs(multipliers).max(initial=0.)))
+
+        return max((((sign * multipliers)[decreasing] + margin) / -(sign * dlambda)[decreasing]).min(), 0.)
@@ -0,0 +1,61 @@
+from coptpy import Model
+import json
+
+
+# Параметры решателя по режимам управления (имена параметров COPT), подобранные benchmark/SolverTuning.py
+# на случайных задачах benchmark/RandomProblems.py. У кусочно-постоянного управления предварительное упрощение
+# модели (Presolve) занимает больше времени, чем решение; для кусочно-линейного быстрее упорядочение
+# разложения BarOrder = 0. Для сплайнов высших степеней выигрыш настроек зависит от задачи, поэтому их профили
+# пусты (параметры решателя по умолчанию); подобранные для своих задач профили читаются load_profiles
+PROFILES = {
+    'constant': {'Presolve': 0},
+    'linear': {'BarOrder': 0},
+    'quadratic': {},
+    'cubic': {},
+}
+
+default_profiles = {mode: dict(parameters) for mode, parameters in PROFILES.items()}
+
+
+def get_profiles() -> dict:
+    return default_profiles
+
+
+def set_profiles(profiles: dict) -> None:
+    """
+    Замена профилей, используемых по умолчанию (режимы, не заданные в profiles, сохраняют свои профили)
+    """
+    for mode, parameters in profiles.items():
+        default_profiles[mode] = dict(parameters)
+
+
+def get_profile(mode: str, parameters: dict = None) -> dict:
+    """
+    Параметры решателя для режима: профиль режима с заменой значений из parameters
+    (значение None возвращает параметру значение решателя по умолчанию)
+    """
+    profile = dict(default_profiles.get(mode, {}))
+    profile.update(parameters or {})
+
+    return {name: value for name, value in profile.items() if value is not None}
+
+
+def apply_profile(M: Model, mode: str, parameters: dict = None) -> None:
+    for name, value in get_profile(mode, parameters).items():
+        M.setParam(name, value)
+
+
+def load_profiles(path: str) -> dict:
+    """
+    Чтение профилей из файла JSON ({режим: {параметр: значение}}) и замена ими профилей по умолчанию
+    """
+    with open(path) as file:
+        profiles = json.load(file)
+    set_profiles(profiles)
+
+    return profiles
+
+
+def save_profiles(path: str, profiles: dict) -> None:
+    with open(path, 'w') as file:
+        json.dump(profiles, file, indent=1)
@@ -0,0 +1,205 @@
+from problem.ProblemStatement import Problem
+from numerical.TerminalCoefficients import calculate_terminal_projections
+from numerical.MatrixExponential import calculate_shift_weights
+from control.MatrixModel import get_name, get_values, build_continuity_matrix, build_quadratic_matrix, \
+    add_terminal_constraints_matrix, get_formulation, add_state_terms, add_terminal_state_constraints, record_model, \
+    solve_model
+from control.Sensitivity import SolutionSensitivity
+from control.SolverProfiles import apply_profile
+from instrumentation.Telemetry import stage
+from numpy import array, repeat, zeros, full, arange, diff, einsum
+from scipy.sparse import csr_matrix, kron, block_diag, identity
+from coptpy import Envr, Model, MVar, COPT
+from math import comb
+
+
+# Названия моделей для распространённых степеней сплайна
+TITLES = {
+    1: 'Optimal Piecewise Linear Control Searching',
+    2: 'Optimal Quadratic Spline Control Searching',
+    3: 'Optimal Cubic Spline Control Searching',
+}
+
+
+# Режимы управления (профили параметров решателя) для распространённых степеней сплайна
+MODES = {
+    1: 'linear',
+    2: 'quadratic',
+    3: 'cubic',
+}
+
+
+def get_title(degree: int) -> str:
+    return TITLES.get(degree, 'Optimal Spline Control of Degree {} Searching'.format(degree))
+
+
+def get_spline_mode(degree: int) -> str:
+    return MODES.get(degree, 'spline{}'.format(degree))
+
+
+def add_control_coefficients_vars(M: Model, r: int, N: int, order: int, names: bool = False):
+    # Коэффициенты p[i, k, o] в порядке (i*N + k)*order + o
+    p = M.addMVar(r * N * order, lb=-COPT.INFINITY, vtype=COPT.CONTINUOUS, nameprefix=get_name('p', names))
+
+    return p
+
+
+def add_smoothness_constraints(M: Model, r: int, nodes, order: int, smoothness: int, p: MVar, names: bool = False,
+                               basis: str = 'global'):
+    if smoothness > 0 and len(nodes) > 2:
+        continuity = build_continuity_matrix(r, nodes, order, smoothness, basis)
+        M.addConstr(continuity @ p == zeros(continuity.shape[0]), name=get_name('smoothness_constraint', names))
+
+
+def build_bernstein_matrix(r: int, nodes, order: int, subdivisions: int = 1, basis: str = 'global'):
+    """
+    Матрица перехода от коэффициентов p[i, k, o] к коэффициентам управления в базисе Бернштейна
+    степени order-1 на каждой из subdivisions равных частей отрезков: строка ((i*N + k)*subdivisions + s)*order + l.
+    Значения полинома на части отрезка лежат между наименьшим и наибольшим коэффициентами Бернштейна,
+    а при делении отрезка коэффициенты сходятся к значениям
+    """
+    nodes = array(nodes, dtype=float)
+    degree = order - 1
+    if basis == 'local':
+        # В нормированном времени tau = (t - t_k)/h_k каждый отрезок совпадает с [0, 1]
+        widths = full((len(nodes) - 1, 1), 1. / subdivisions)
+        starts = widths * arange(subdivisions)
+    else:
+        widths = diff(nodes)[:, None] / subdivisions
+        starts = nodes[:-1, None] + widths * arange(subdivisions)
+
+    # На части [t0, t0 + w] с s = w*sigma: (t0 + s)^o = sum_j weights[o, j]*w^j*sigma^j
+    weights = calculate_shift_weights(starts, order)
+    powers = widths[:, :, None] ** arange(order)
+
+    # Коэффициент Бернштейна b_l = sum_(j <= l) C(l, j)/C(degree, j)*c_j для мономов c_j*sigma^j
+    conversion = zeros((order, order))
+    for l in range(order):
+        for j in range(l + 1):
+            conversion[l, j] = comb(l, j) / comb(degree, j)
+
+    local = einsum('lj,ksj,ksoj->kslo', conversion, powers, weights)
+    blocks = [block.reshape(subdivisions * order, order) for block in local]
+
+    return csr_matrix(kron(identity(r), block_diag(blocks)))
+
+
+def add_straight_constraints(M: Model, L1, L2, r: int, nodes, order: int, p: MVar, subdivisions: int = 1,
+                             names: bool = False, basis: str = 'global'):
+    # Достаточные условия L1 <= u(t) <= L2: ограничения на коэффициенты Бернштейна
+    bernstein = build_bernstein_matrix(r, nodes, order, subdivisions, basis)
+    size = bernstein.shape[0] // r
+    lower = repeat(L1, size)
+    upper = repeat(L2, size)
+
+    M.addConstr(bernstein @ p >= lower, name=get_name('lower_straight_constraint', names))
+    M.addConstr(bernstein @ p <= upper, name=get_name('upper_straight_constraint', names))
+
+
+def add_terminal_constraints(M: Model, A, B, C, H, c, x0, g, nodes, r, m, order: int, p: MVar, method='expm',
+                             names=False, basis='global'):
+    # Проекции на строки H и c решения уравнения dx/dt = Ax + C при нулевом управлении в точке T
+    # и выражений int_(t_k)^(t_(k+1)) (exp(A(T-t))b_i*phi_o(t)) dt для функций базиса phi_o
+    HxT, HD, cD = calculate_terminal_projections(A, B, C, x0, H, c, nodes, order, method, basis=basis)
+
+    h = g - HxT
+    terminal = add_terminal_constraints_matrix(M, HD, h, p, names)
+
+    return cD, terminal
+
+
+def add_objective(M: Model, R, r, nodes, cx, order: int, p: MVar, state_cost=None, basis: str = 'global'):
+    # Выражение int_0^T(u(t)'*R*u(t))dt
+    quadratic_u = p @ (build_quadratic_matrix(R, nodes, order, basis) @ p)
+
+    # Выражение c*x(T) (в сжатой формулировке без свободного члена)
+    objective = quadratic_u + cx
+
+    # Выражение int_0^T(x(t)'*Q*x(t))dt
+    if state_cost is not None:
+        objective = objective + state_cost
+
+    # Задание целевой функции
+    M.setObjective(objective, sense=COPT.MINIMIZE)
+
+
+def build_spline_model(M: Model, P: Problem, degree: int, smoothness: int = None, subdivisions: int = None,
+                       names: bool = False, constraints: dict = None):
+    """
+    Модель поиска сплайна степени degree с непрерывными производными до порядка smoothness-1
+    (по умолчанию smoothness = degree, то есть сплайн дефекта 1). Прямые ограничения задаются линейными
+    неравенствами на коэффициенты Бернштейна, поэтому задача остаётся квадратичной при любой степени
+    Базис на отрезках задаётся P.basis: мономы t^o ('global') или tau^o, tau = (t - t_k)/h_k ('local');
+    в нормированном базисе коэффициенты всех членов модели одного порядка, что улучшает обусловленность.
+    Формулировка (сжатая или с состояниями в узлах) задаётся P.formulation (см. get_formulation)
+    :param subdivisions: количество частей отрезка, на которых проверяются прямые ограничения (чем больше,
+                         тем ближе достаточные условия к точным); по умолчанию 1 для степени не выше 1,
+                         когда условия точные, и 2 для более высоких степеней
+    :param constraints: словарь, в который записывается ограничение начального состояния 'initial'
+                        (None без состояний в узлах) для изменения x0 без перестроения модели
+    """
+    order = degree + 1
+    if subdivisions is None:
+        subdivisions = 1 if degree <= 1 else 2
+    if smoothness is None:
+        smoothness = degree
+    if not 0 <= smoothness <= degree:
+        raise ValueError('Smoothness {} is not in [0, {}]'.format(smoothness, degree))
+
+    with stage('build'):
+        p = add_control_coefficients_vars(M, P.r, P.N, order, names)
+
+        nodes = P.get_nodes()
+        add_smoothness_constraints(M, P.r, nodes, order, smoothness, p, names, P.basis)
+        add_straight_constraints(M, P.L1, P.L2, P.r, nodes, order, p, subdivisions, names, P.basis)
+        formulation = get_formulation(P)
+        X, state_cost, initial = add_state_terms(M, P, order, p, formulation, names)
+        if formulation == 'shooting':
+            terminal = add_terminal_state_constraints(M, P.H, P.g, X, P.n, names)
+            cx = P.c @ X[P.N * P.n:]
+        else:
+            cD, terminal = add_terminal_constraints(M, P.A, P.B, P.C, P.H, P.c, P.x0, P.g, nodes, P.r, P.m, order,
+                                                    p, names=names, basis=P.basis)
+            cx = cD.reshape(-1) @ p
+
+        add_objective(M, P.R, P.r, nodes, cx, order, p, state_cost, P.basis)
+
+    record_model(M)
+    if constraints is not None:
+        constraints['initial'] = initial
+
+    return p, terminal
+
+
+def get_spline_builder(degree: int, smoothness: int = None, subdivisions: int = None):
+    """
+    Функция построения модели с сигнатурой (M, P, names) для заданной степени сплайна
+    """
+    def build(M: Model, P: Problem, names: bool = False, constraints: dict = None):
+        return build_spline_model(M, P, degree, smoothness, subdivisions, names, constraints)
+
+    return build
+
+
+def search_spline_control(P: Problem, degree: int, smoothness: int = None, subdivisions: int = None,
+                          names: bool = False, sensitivity: bool = False, parameters: dict = None):
+    """
+    Поиск оптимального сплайнового управления
+    :param sensitivity: вернуть также двойственные оценки и чувствительность решения к x0 и g
+                        (см. SolutionSensitivity)
+    :param parameters: параметры решателя, заменяющие профиль режима (см. SolverProfiles)
+    """
+    env = Envr()
+    M: Model = env.createModel(get_title(degree))
+    apply_profile(M, get_spline_mode(degree), parameters)
+
+    p, terminal = build_spline_model(M, P, degree, smoothness, subdivisions, names)
+
+    solve_model(M, terminal)
+
+    # Коэффициенты управления одним массивом формы (r, N, degree + 1)
+    values = get_values(p).reshape(P.r, P.N, degree + 1)
+    if sensitivity:
+        return values, SolutionSensitivity(M, p, terminal, P, degree + 1)
+
+    return values
@@ -0,0 +1,137 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+import logging
+import json
+
+
+logger = logging.getLogger(__name__)
+
+
+class Telemetry(object):
+
+    def __init__(self, emit: bool = True) -> None:
+        """
+        Накопитель телеметрии: длительности этапов (с вложенностью вида 'build/precompute'), счётчики
+        и статистика решателя. Один накопитель можно включить в нескольких потоках (record(telemetry)):
+        записи защищены блокировкой, а вложенность этапов у каждого потока своя
+        :param emit: выводить события в журнал logging (логгер instrumentation.Telemetry) в виде JSON
+        """
+        self.emit_events = emit
+        self.lock = Lock()
+        self.stages = {}
+        self.counts = {}
+        self.solves = []
+
+    def emit(self, event: str, **fields) -> None:
+        if self.emit_events:
+            logger.info(json.dumps(dict(event=event, **fields), default=float))
+
+    def add_stage(self, path: str, duration: float) -> None:
+        with self.lock:
+            entry = self.stages.setdefault(path, {'calls': 0, 'time': 0.})
+            entry['calls'] += 1
+            entry['time'] += duration
+        self.emit('stage', stage=path, time=duration)
+
+    def add_count(self, name: str, value) -> None:
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def add_solve(self, statistics: dict) -> None:
+        with self.lock:
+            self.solves.append(statistics)
+        self.emit('solve', **statistics)
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {'stages': {path: dict(entry) for path, entry in self.stages.items()}, 'counts': dict(self.counts),
+                    'solves': list(self.solves)}
+
+
+class Stage(object):
+    __slots__ = ('telemetry', 'name', 'start', 'token')
+
+    def __init__(self, telemetry: Telemetry, name: str) -> None:
+        self.telemetry = telemetry
+        self.name = name
+        self.start = None
+        self.token = None
+
+    def __enter__(self):
+        self.token = _stack.set(_stack.get() + (self.name,))
+        self.start = perf_counter()
+
+    def __exit__(self, *exception) -> bool:
+        duration = perf_counter() - self.start
+        path = '/'.join(_stack.get())
+        _stack.reset(self.token)
+        self.telemetry.add_stage(path, duration)
+
+        return False
+
+
+class NullStage(object):
+    """
+    Этап при выключенной телеметрии: ничего не делает
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exception) -> bool:
+        return False
+
+
+# Текущий накопитель и вложенность этапов свои у каждого потока (и контекста asyncio): в многопоточной
+# службе решения запросы не смешивают пути этапов. None --- телеметрия выключена, и stage/count сводятся
+# к одной проверке. Новые потоки начинают с выключенной телеметрией
+_active = ContextVar('telemetry', default=None)
+_stack = ContextVar('telemetry_stack', default=())
+_null_stage = NullStage()
+
+
+def is_enabled() -> bool:
+    return _active.get() is not None
+
+
+def get_telemetry() -> Telemetry:
+    return _active.get()
+
+
+def stage(name: str):
+    """
+    Контекстный менеджер замера этапа: with stage('solve'): ...
+    """
+    telemetry = _active.get()
+    if telemetry is None:
+        return _null_stage
+
+    return Stage(telemetry, name)
+
+
+def count(name: str, value=1) -> None:
+    telemetry = _active.get()
+    if telemetry is not None:
+        telemetry.add_count(name, value)
+
+
+def record_solve(statistics: dict) -> None:
+    telemetry = _active.get()
+    if telemetry is not None:
+        telemetry.add_solve(statistics)
+
+
+@contextmanager
+def record(telemetry: Telemetry = None):
+    """
+    Включение телеметрии на время блока в текущем потоке: with record() as telemetry: ...
+    """
+    telemetry = Telemetry() if telemetry is None else telemetry
+    token = _active.set(telemetry)
+    try:
+        yield telemetry
+    finally:
+        _active.reset(token)
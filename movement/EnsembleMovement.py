@@ -0,0 +1,165 @@
+from problem.ProblemStatement import Problem
+from numerical.EnsemblePropagation import propagate_ensemble
+from instrumentation.Telemetry import stage
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from numpy import asarray, linspace, zeros, full, inf, minimum, maximum, sqrt, concatenate, quantile, einsum
+from numpy.random import SeedSequence, default_rng
+from scipy.sparse import issparse
+
+
+# Состояние процесса-исполнителя: постановка задачи, управление и параметры возмущений
+_worker_state = {}
+
+
+class EnsembleStatistics(object):
+
+    def __init__(self, t_grid, n: int) -> None:
+        """
+        Статистики набора траекторий, накапливаемые по частям: среднее и дисперсия состояний в моментах
+        сетки (объединение частей по формулам Чана), огибающие и ошибки терминальных условий
+        (по одному числу на траекторию), поэтому сами траектории не хранятся
+        """
+        self.t_grid = t_grid
+        self.size = 0
+        self.mean = zeros((len(t_grid), n))
+        self.squares = zeros((len(t_grid), n))
+        self.lower = full((len(t_grid), n), inf)
+        self.upper = full((len(t_grid), n), -inf)
+        self.errors = []
+
+    def update(self, part: dict) -> None:
+        """
+        Добавление статистик части набора (см. summarize_chunk)
+        """
+        size = self.size + part['size']
+        delta = part['mean'] - self.mean
+        self.mean = self.mean + delta * (part['size'] / size)
+        self.squares = self.squares + part['squares'] + delta ** 2 * (self.size * part['size'] / size)
+        self.lower = minimum(self.lower, part['lower'])
+        self.upper = maximum(self.upper, part['upper'])
+        self.errors.append(part['errors'])
+        self.size = size
+
+    def get_summary(self, quantiles=(0.5, 0.9, 0.99)) -> dict:
+        """
+        :return: словарь: t_grid, size, mean, std, lower, upper (массивы формы (len(t_grid), n)),
+                 terminal_errors --- ошибки |H*x(T) - g| всех траекторий,
+                 quantiles --- словарь квантилей ошибок по уровням
+        """
+        errors = concatenate(self.errors) if self.errors else zeros(0)
+
+        return {
+            't_grid': self.t_grid,
+            'size': self.size,
+            'mean': self.mean,
+            'std': sqrt(self.squares / max(self.size - 1, 1)),
+            'lower': self.lower,
+            'upper': self.upper,
+            'terminal_errors': errors,
+            'quantiles': {level: float(quantile(errors, level)) for level in quantiles} if errors.size else {},
+        }
+
+
+def generate_perturbations(P: Problem, size: int, seed: SeedSequence, x0_deviation=0., A_deviation: float = 0.,
+                           B_deviation: float = 0.) -> dict:
+    """
+    Возмущённые параметры части набора: x0 + x0_deviation*xi (xi --- стандартный нормальный вектор),
+    A и B с элементами, умноженными на 1 + deviation*xi (нулевые элементы остаются нулевыми)
+    :param x0_deviation: стандартное отклонение (число или вектор формы (n,))
+    :return: словарь x0 (массив формы (size, n)) и при ненулевых отклонениях A, B (массивы членов набора)
+    """
+    rng = default_rng(seed)
+    x0 = asarray(P.x0, dtype=float)
+    perturbed = {'x0': x0 + asarray(x0_deviation, dtype=float) * rng.standard_normal((size, P.n))}
+    for name, deviation in (('A', A_deviation), ('B', B_deviation)):
+        if deviation > 0:
+            M = getattr(P, name)
+            M = M.toarray() if issparse(M) else asarray(M, dtype=float)
+            perturbed[name] = M * (1. + deviation * rng.standard_normal((size,) + M.shape))
+
+    return perturbed
+
+
+def summarize_chunk(P: Problem, coefficients, t_grid, size: int, seed: SeedSequence, x0_deviation=0.,
+                    A_deviation: float = 0., B_deviation: float = 0.) -> dict:
+    """
+    Моделирование части набора одним вызовом propagate_ensemble и её статистики
+    """
+    perturbed = generate_perturbations(P, size, seed, x0_deviation, A_deviation, B_deviation)
+    x_grid = propagate_ensemble(perturbed.get('A', P.A), perturbed.get('B', P.B), P.C, perturbed['x0'],
+                                coefficients, P.get_nodes(), t_grid, P.basis)
+
+    H = P.H.toarray() if issparse(P.H) else asarray(P.H, dtype=float)
+    residuals = einsum('mn,en->em', H, x_grid[:, -1]) - asarray(P.g, dtype=float)
+    mean = x_grid.mean(axis=0)
+
+    return {
+        'size': size,
+        'mean': mean,
+        'squares': ((x_grid - mean) ** 2).sum(axis=0),
+        'lower': x_grid.min(axis=0),
+        'upper': x_grid.max(axis=0),
+        'errors': sqrt((residuals ** 2).sum(axis=1)),
+    }
+
+
+def initialize_worker(P: Problem, coefficients, t_grid, deviations: dict) -> None:
+    _worker_state.clear()
+    _worker_state.update(P=P, coefficients=coefficients, t_grid=t_grid, deviations=deviations)
+
+
+def simulate_worker_chunk(size: int, seed: SeedSequence) -> dict:
+    state = _worker_state
+
+    return summarize_chunk(state['P'], state['coefficients'], state['t_grid'], size, seed, **state['deviations'])
+
+
+def simulate_ensemble(P: Problem, coefficients, samples: int = 1000, x0_deviation=0., A_deviation: float = 0.,
+                      B_deviation: float = 0., t_grid=None, chunk_size: int = 256, workers: int = None,
+                      seed: int = 0, quantiles=(0.5, 0.9, 0.99)) -> dict:
+    """
+    Моделирование набора возмущённых траекторий при найденном управлении для оценки устойчивости решения.
+    Набор обрабатывается частями по chunk_size траекторий: каждая часть моделируется сразу массивом формы
+    (chunk_size, len(t_grid), n), после чего от неё остаются только статистики (см. EnsembleStatistics).
+    Части получают независимые ветви генератора случайных чисел, поэтому результат не зависит
+    от количества процессов и порядка завершения частей
+    :param coefficients: коэффициенты управления, массив формы (r, N, order) в базисе P.basis
+    :param x0_deviation: стандартное отклонение начального состояния (число или вектор формы (n,))
+    :param A_deviation: относительное стандартное отклонение элементов A
+    :param B_deviation: относительное стандартное отклонение элементов B
+    :param t_grid: моменты времени статистик (по умолчанию 101 точка на [0, T])
+    :param workers: количество процессов (по умолчанию части моделируются в текущем процессе)
+    :return: словарь статистик (см. EnsembleStatistics.get_summary)
+    """
+    coefficients = asarray(coefficients, dtype=float).reshape(P.r, P.N, -1)
+    if t_grid is None:
+        t_grid = linspace(0, P.T, 101)
+    deviations = {'x0_deviation': x0_deviation, 'A_deviation': A_deviation, 'B_deviation': B_deviation}
+
+    sizes = [min(chunk_size, samples - start) for start in range(0, samples, chunk_size)]
+    seeds = SeedSequence(seed).spawn(len(sizes))
+    statistics = EnsembleStatistics(t_grid, P.n)
+
+    with stage('simulate'):
+        if workers is None:
+            for size, chunk_seed in zip(sizes, seeds):
+                statistics.update(summarize_chunk(P, coefficients, t_grid, size, chunk_seed, **deviations))
+
+            return statistics.get_summary(quantiles)
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=initialize_worker,
+                                 initargs=(P, coefficients, t_grid, deviations)) as executor:
+            # Количество одновременно поставленных частей ограничено, чтобы не хранить в памяти весь набор
+            pending = set()
+            for size, chunk_seed in zip(sizes, seeds):
+                pending.add(executor.submit(simulate_worker_chunk, size, chunk_seed))
+                if len(pending) >= 2 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        statistics.update(future.result())
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    statistics.update(future.result())
+
+    return statistics.get_summary(quantiles)
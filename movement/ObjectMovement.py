@@ -0,0 +1,26 @@
+from control.PiecewisePolynomialControl import PiecewisePolynomialControl
+from numerical.ExactPropagation import propagate_polynomial_control
+from instrumentation.Telemetry import stage
+from numpy import linspace, asarray
+
+
+def calculate_control(coefficients, nodes, r, basis='global'):
+    return PiecewisePolynomialControl(asarray(coefficients).reshape(r, len(nodes) - 1, -1), nodes, basis)
+
+
+def calculate_movement(P, coefficients, grid_size: int = 501):
+    """
+    Управление и движение объекта на равномерной сетке при кусочно-полиномиальном управлении любого режима
+    :param coefficients: коэффициенты управления, массив формы (r, N, order) или (r*N*order,)
+    :return: t_grid, x_grid, u_grid
+    """
+    with stage('simulate'):
+        t_grid = linspace(0, P.T, grid_size)
+
+        func_u = calculate_control(coefficients, P.get_nodes(), P.r, P.basis)
+        u_grid = func_u(t_grid)
+
+        x_grid = propagate_polynomial_control(P.A, P.B, P.C, P.x0, func_u.coefficients, func_u.nodes, t_grid,
+                                              func_u.basis)
+
+    return t_grid, x_grid, u_grid
@@ -1,22 +1,6 @@
-from numpy import linspace, array
-from scipy.integrate import odeint
-
-
-def calculate_control(u, T, N, r):
-    return lambda t: array([(u[i, int(t*N/T)] if t < T else u[i, N-1]) for i in range(r)])
-
-
-def closed_model(x, t, A, B, C, func_u):
-    return A.dot(x) + B.dot(func_u(t)) + C
+# Модуль режима сохранён для совместимости: расчёт движения общий для всех режимов (см. movement.ObjectMovement)
+from movement.ObjectMovement import calculate_movement
 
 
 def calculate_pcc_movement(P, u):
-    grid_size = 501
-    t_grid = linspace(0, P.T, grid_size)
-
-    func_u = calculate_control(u, P.T, P.N, P.r)
-    u_grid = array([func_u(t) for t in t_grid])
-
-    x_grid = odeint(closed_model, P.x0, t_grid, args=(P.A, P.B, P.C, func_u))
-
-    return t_grid, x_grid, u_grid
+    return calculate_movement(P, u)
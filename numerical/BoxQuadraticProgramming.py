@@ -0,0 +1,55 @@
+from instrumentation.Telemetry import count
+from numpy import array, clip, zeros, eye, trace, abs as np_abs
+from numpy.linalg import solve, LinAlgError
+
+
+def solve_separable_box_qp(a, q, G, h, lb, ub, multipliers=None, tolerance: float = 1e-9, max_iterations: int = 100):
+    """
+    Решение задачи sum_j (a_j*u_j^2 + q_j*u_j) --> min, Gu = h, lb <= u <= ub при a_j > 0
+    полугладким методом Ньютона для m-мерной двойственной задачи
+    :param multipliers: начальное приближение множителей (например, решение более грубой задачи)
+    :return: 1) u --- решение,
+             2) multipliers --- множители Лагранжа ограничений Gu = h,
+             3) converged --- признак сходимости (при недопустимой задаче метод не сходится)
+    """
+    m = len(h)
+    multipliers = zeros(m) if multipliers is None else array(multipliers, dtype=float)
+    scale = max(1., float(np_abs(h).max()) if m > 0 else 1.)
+
+    def minimize_lagrangian(multipliers):
+        # Минимум функции Лагранжа по u при фиксированных множителях распадается по компонентам
+        u = clip((G.T.dot(multipliers) - q) / (2 * a), lb, ub)
+        value = (a * u * u + q * u).sum() - multipliers.dot(G.dot(u) - h)
+
+        return u, value
+
+    u, value = minimize_lagrangian(multipliers)
+    for _ in range(max_iterations):
+        count('newton_iterations')
+        residual = h - G.dot(u)
+        if np_abs(residual).max() <= tolerance * scale:
+            return u, multipliers, True
+
+        # Обобщённый гессиан двойственной функции: G*diag(free/(2a))*G'
+        free = (u > lb) & (u < ub)
+        hessian = (G * (free / (2 * a))).dot(G.T)
+        hessian += 1e-12 * max(1., trace(hessian)) * eye(m)
+        try:
+            direction = solve(hessian, residual)
+        except LinAlgError:
+            break
+
+        # Двойственная функция вогнута: шаг уменьшается, пока не выполнено условие Армихо
+        step = 1.
+        slope = residual.dot(direction)
+        while step > 1e-12:
+            candidate_u, candidate_value = minimize_lagrangian(multipliers + step * direction)
+            if candidate_value >= value + 1e-4 * step * slope:
+                break
+            step /= 2
+        else:
+            break
+        multipliers = multipliers + step * direction
+        u, value = candidate_u, candidate_value
+
+    return u, multipliers, False
@@ -0,0 +1,189 @@
+from collections import OrderedDict
+from hashlib import sha1
+from threading import Lock
+from numpy import asarray, save, load, ndarray
+from scipy.sparse import issparse, csr_matrix
+import os
+
+
+def calculate_key(*parts) -> str:
+    """
+    Хеш содержимого входных данных предвычислений (массивов, разреженных матриц и скаляров)
+    """
+    digest = sha1()
+    for part in parts:
+        if issparse(part):
+            part = csr_matrix(part, dtype=float, copy=True)
+            part.sum_duplicates()
+            digest.update(('sparse' + str(part.shape)).encode())
+            for values in (part.data, part.indices.astype('i8'), part.indptr.astype('i8')):
+                digest.update(values.tobytes())
+        elif isinstance(part, (ndarray, list, tuple)):
+            part = asarray(part, dtype=float)
+            digest.update(str(part.shape).encode())
+            digest.update(part.tobytes())
+        else:
+            digest.update(repr(part).encode())
+        digest.update(b'|')
+
+    return digest.hexdigest()
+
+
+class PrecomputationCache(object):
+
+    def __init__(self, max_entries: int = 32, directory: str = None, max_disk_size: int = 2 ** 30,
+                 mmap: bool = True) -> None:
+        """
+        Кэш предвычисленных данных: LRU в памяти и, при заданном directory, хранилище .npy на диске
+        :param max_entries: максимальное количество записей в памяти (0 --- кэш в памяти отключён)
+        :param directory: каталог дискового хранилища
+        :param max_disk_size: максимальный суммарный размер файлов на диске в байтах
+        :param mmap: открывать массивы с диска через отображение в память
+        """
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_disk_size = max_disk_size
+        self.mmap = mmap
+
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def get(self, key: str):
+        """
+        Поиск записи сначала в памяти, затем на диске
+        :return: словарь массивов или None
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+
+        if entry is not None:
+            self.touch(key, entry)
+            return entry
+
+        entry = self.load(key)
+        if entry is not None:
+            self.remember(key, entry)
+
+        return entry
+
+    def put(self, key: str, entry: dict) -> None:
+        """
+        Сохранение записи (словаря массивов) в памяти и на диске. Запись хранит представления массивов только
+        для чтения: флаги самих массивов (например, узлов из постановки задачи) не меняются
+        """
+        for name, value in entry.items():
+            entry[name] = value.view()
+            entry[name].flags.writeable = False
+        self.remember(key, entry)
+        self.store(key, entry)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def remember(self, key: str, entry: dict) -> None:
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_path(self, key: str, name: str) -> str:
+        return os.path.join(self.directory, '{}_{}.npy'.format(key, name))
+
+    def touch(self, key: str, entry: dict) -> None:
+        """
+        Обновление времени доступа к файлам записи, которое используется при вытеснении
+        """
+        if self.directory is None:
+            return
+        for name in entry:
+            try:
+                os.utime(self.get_path(key, name))
+            except OSError:
+                pass
+
+    def load(self, key: str):
+        if self.directory is None:
+            return None
+
+        prefix = key + '_'
+        names = [file[len(prefix):-len('.npy')] for file in os.listdir(self.directory)
+                 if file.startswith(prefix) and file.endswith('.npy')]
+        if not names:
+            return None
+
+        entry = {}
+        try:
+            for name in names:
+                path = self.get_path(key, name)
+                entry[name] = load(path, mmap_mode='r' if self.mmap else None)
+        except (OSError, ValueError):
+            return None
+        self.touch(key, entry)
+
+        return entry
+
+    def store(self, key: str, entry: dict) -> None:
+        if self.directory is None:
+            return
+
+        for name, value in entry.items():
+            path = self.get_path(key, name)
+            # Запись через временный файл, чтобы параллельные процессы не читали незаконченный массив
+            temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+            with open(temporary_path, 'wb') as file:
+                save(file, value)
+            os.replace(temporary_path, path)
+
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Удаление наиболее давно использованных записей, пока суммарный размер превышает max_disk_size
+        """
+        groups = {}
+        for file in os.listdir(self.directory):
+            if not file.endswith('.npy'):
+                continue
+            path = os.path.join(self.directory, file)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            key = file.split('_', 1)[0]
+            size, mtime, paths = groups.get(key, (0, 0., []))
+            groups[key] = (size + stat.st_size, max(mtime, stat.st_mtime), paths + [path])
+
+        total_size = sum(size for size, _, _ in groups.values())
+        for key, (size, _, paths) in sorted(groups.items(), key=lambda item: item[1][1]):
+            if total_size <= self.max_disk_size:
+                break
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total_size -= size
+
+
+default_cache = PrecomputationCache()
+
+
+def get_default_cache() -> PrecomputationCache:
+    return default_cache
+
+
+def set_default_cache(cache: PrecomputationCache) -> None:
+    """
+    Замена кэша, используемого по умолчанию при вычислении коэффициентов терминальных ограничений
+    """
+    global default_cache
+    default_cache = cache
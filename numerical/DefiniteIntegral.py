@@ -1,11 +1,23 @@
-from scipy.integrate import quad
-from numpy import array
+from instrumentation.Telemetry import count
 
 
-def integrate(func_array, t_start: float, t_finish: float):
-    int_array = []
-    for j in range(len(func_array)):
-        I, err = quad(func_array[j], t_start, t_finish)
-        int_array.append(I)
+def integrate(spline, t_start: float, t_finish: float):
+    """
+    Выражение int_(t_start)^(t_finish) (spline(t)) dt для всех компонент сплайна
+    """
+    count('integrations')
 
-    return array(int_array)
+    return spline.integrate(t_start, t_finish)
+
+
+def integrate_segments(spline, t_grid):
+    """
+    Интегралы сплайна по всем соседним отрезкам сетки [t_grid[k], t_grid[k+1]]
+    через однократно построенную первообразную
+    :return: массив формы (len(t_grid) - 1, n)
+    """
+    count('integrations')
+    antiderivative = spline.antiderivative()
+    values = antiderivative(t_grid)
+
+    return values[1:] - values[:-1]
@@ -1,3 +1,4 @@
+from instrumentation.Telemetry import count
 from numpy import array
 from scipy.integrate import odeint
 
@@ -7,6 +8,7 @@ def linear_equation(x, t, A: array):
 
 
 def solve_linear_differential_equation(A, x0, t_grid):
+    count('ode_solves')
     x = odeint(linear_equation, x0, t_grid, args=(A,))
 
     return x
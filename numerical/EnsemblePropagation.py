@@ -0,0 +1,85 @@
+from numerical.ExactPropagation import calculate_step_coefficients
+from instrumentation.Telemetry import count
+from math import factorial
+from numpy import zeros, eye, empty, einsum, asarray, unique, around, arange, searchsorted, broadcast_to, matmul
+from scipy.linalg import expm
+from scipy.sparse import issparse
+
+
+def calculate_ensemble_integrals(A, B, C, h: float, order: int):
+    """
+    Интегралы по отрезку длины h сразу для набора систем (пакетная экспонента блочных матриц, метод Ван Лоана)
+    :param A: массив формы (E, n, n)
+    :param B: массив формы (E, n, r)
+    :return: 1) Phi --- массив формы (E, n, n), Phi[e] = exp(A[e]h),
+             2) L --- массив формы (E, order, n, r + 1), L[e, j] = int_0^h(exp(A[e](h-s))[B[e], C]*s^j)ds
+    """
+    E, n, _ = A.shape
+    r = B.shape[2] + 1
+
+    size = n + order * r
+    augmented = zeros((E, size, size))
+    augmented[:, :n, :n] = A
+    augmented[:, :n, n:n + r - 1] = B
+    augmented[:, :n, n + r - 1] = C
+    for j in range(order - 1):
+        augmented[:, n + j * r:n + (j + 1) * r, n + (j + 1) * r:n + (j + 2) * r] = eye(r)
+
+    count('expm_calls', E)
+    exponent = expm(augmented * h)
+
+    L = empty((E, order, n, r))
+    for j in range(order):
+        L[:, j] = factorial(j) * exponent[:, :n, n + j * r:n + (j + 1) * r]
+
+    return exponent[:, :n, :n], L
+
+
+def propagate_ensemble(A, B, C, x0, coefficients, nodes, t_grid, basis: str = 'global'):
+    """
+    Точное решение уравнения dx/dt = Ax + Bu + C сразу для набора начальных состояний и систем
+    при одном кусочно-полиномиальном управлении (см. propagate_polynomial_control).
+    Матрицы шага вычисляются пакетно для каждой различной длины шага; если A и B общие для набора,
+    они вычисляются один раз, и шаг по времени --- одно матричное умножение для всего набора.
+    Разреженные A и B заменяются плотными
+    :param A: матрица формы (n, n) или массив формы (E, n, n) матриц членов набора
+    :param B: матрица формы (n, r) или массив формы (E, n, r)
+    :param x0: вектор формы (n,) или массив формы (E, n)
+    :return: x_grid --- массив формы (E, len(t_grid), n)
+    """
+    A, B = [M.toarray() if issparse(M) else asarray(M, dtype=float) for M in (A, B)]
+    C = asarray(C, dtype=float)
+    x0 = asarray(x0, dtype=float)
+    n = A.shape[-1]
+    r = B.shape[-1]
+    order = coefficients.shape[2]
+
+    # Общие матрицы образуют набор из одной системы, который согласуется с остальными при вычислениях
+    systems = max(len(M) if M.ndim == 3 else 1 for M in (A, B))
+    A = broadcast_to(A, (systems, n, n))
+    B = broadcast_to(B, (systems, n, r))
+    E = max(systems, len(x0) if x0.ndim == 2 else 1)
+
+    times, steps, local = calculate_step_coefficients(coefficients, nodes, t_grid, basis)
+
+    keys, step_indices = unique(around(steps, 12), return_inverse=True)
+    transitions = empty((len(keys), systems, n, n))
+    forcing = empty((len(steps), systems, n))
+    for index in range(len(keys)):
+        group = arange(len(steps))[step_indices == index]
+        transitions[index], L = calculate_ensemble_integrals(A, B, C, steps[group[0]], order)
+        forcing[group] = einsum('eonr,sro->sen', L[..., :r], local[group]) + L[:, 0, :, r]
+
+    # Сохраняются только состояния в моментах сетки
+    positions = searchsorted(times, t_grid)
+    x_grid = empty((E, len(t_grid), n))
+    x = broadcast_to(x0, (E, n)).copy()
+    saved = 0
+    for j in range(len(steps) + 1):
+        if j > 0:
+            x = matmul(transitions[step_indices[j - 1]], x[:, :, None])[:, :, 0] + forcing[j - 1]
+        while saved < len(positions) and positions[saved] == j:
+            x_grid[:, saved] = x
+            saved += 1
+
+    return x_grid
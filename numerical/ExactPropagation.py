@@ -0,0 +1,94 @@
+from numerical.MatrixExponential import calculate_local_integrals, calculate_shift_weights
+from instrumentation.Telemetry import count
+from math import factorial
+from numpy import empty, zeros, column_stack, concatenate, unique, searchsorted, einsum, minimum, arange, around, \
+    asarray, diff
+from scipy.sparse import issparse, csr_matrix, bmat, diags
+from scipy.sparse.linalg import expm_multiply
+
+
+def calculate_step_coefficients(coefficients, nodes, t_grid, basis: str = 'global'):
+    """
+    Шаги по объединению сетки и узлов (каждый шаг лежит внутри одного отрезка) и коэффициенты управления
+    во времени, отсчитываемом от начала каждого шага
+    :return: 1) times --- моменты начала и конца шагов,
+             2) steps --- длины шагов,
+             3) local --- массив формы (len(steps), r, order)
+    """
+    N = coefficients.shape[1]
+    order = coefficients.shape[2]
+
+    times = unique(concatenate((t_grid, nodes)))
+    starts = times[:-1]
+    steps = times[1:] - starts
+    segments = minimum(searchsorted(nodes, starts, side='right') - 1, N - 1)
+
+    if basis == 'local':
+        widths = diff(nodes)[segments]
+        scaled = coefficients[:, segments, :] * widths[:, None] ** -arange(order, dtype=float)
+        local = einsum('iso,soj->sij', scaled, calculate_shift_weights(starts - nodes[segments], order))
+    else:
+        local = einsum('iso,soj->sij', coefficients[:, segments, :], calculate_shift_weights(starts, order))
+
+    return times, steps, local
+
+
+def propagate_polynomial_control(A, B, C, x0, coefficients, nodes, t_grid, basis: str = 'global'):
+    """
+    Точное решение уравнения dx/dt = Ax + Bu + C при кусочно-полиномиальном управлении
+    u_i(t) = sum_o coefficients[i, k, o]*t^o на отрезках [nodes[k], nodes[k+1]]
+    (для basis = 'local' --- sum_o coefficients[i, k, o]*((t - nodes[k])/(nodes[k+1] - nodes[k]))^o)
+    :param t_grid: возрастающая сетка моментов времени внутри [nodes[0], nodes[-1]], t_grid[0] = nodes[0]
+    :return: x_grid --- массив формы (len(t_grid), n)
+    """
+    n = A.shape[0]
+    r = coefficients.shape[0]
+    order = coefficients.shape[2]
+    times, steps, local = calculate_step_coefficients(coefficients, nodes, t_grid, basis)
+
+    if issparse(A):
+        return propagate_sparse(A, B, C, x0, local, steps, times, t_grid)
+
+    # Матрицы шага вычисляются один раз для каждой различной длины шага; столбец C добавляется к B
+    # как вход с постоянным единичным управлением. Вклад управления на всех шагах вычисляется сразу
+    keys, step_indices = unique(around(steps, 12), return_inverse=True)
+    transitions = empty((len(keys), n, n))
+    forcing = empty((len(steps), n))
+    for index, step in enumerate(keys):
+        group = arange(len(steps))[step_indices == index]
+        transitions[index], L = calculate_local_integrals(A, column_stack((B, C)), steps[group[0]], order)
+        forcing[group] = einsum('onr,sro->sn', L[:, :, :r], local[group]) + L[0, :, r]
+
+    x_times = empty((len(times), n))
+    x_times[0] = x0
+    for j in range(len(steps)):
+        x_times[j + 1] = transitions[step_indices[j]].dot(x_times[j]) + forcing[j]
+
+    return x_times[searchsorted(times, t_grid)]
+
+
+def propagate_sparse(A, B, C, x0, local, steps, times, t_grid):
+    """
+    Шаги для разреженной A: на шаге длины h состояние (x, e_0) переносится действием экспоненты матрицы
+    [[A, F], [0, S]], где S --- цепочка интеграторов (s^j/j!), а столбцы F --- B*a_j*j! (и C при j = 0)
+    """
+    n = A.shape[0]
+    order = local.shape[2]
+    A = csr_matrix(A)
+    chain = diags([1.] * (order - 1), -1, shape=(order, order), format='csr')
+    scales = asarray([factorial(j) for j in range(order)], dtype=float)
+
+    x_times = empty((len(times), n))
+    x_times[0] = x0
+    start = zeros(n + order)
+    start[n] = 1.
+    for j in range(len(steps)):
+        forcing = B.dot(local[j]) * scales
+        forcing[:, 0] += C
+        augmented = bmat([[A, csr_matrix(forcing)], [None, chain]], format='csr')
+
+        start[:n] = x_times[j]
+        count('expm_actions')
+        x_times[j + 1] = expm_multiply(augmented * steps[j], start)[:n]
+
+    return x_times[searchsorted(times, t_grid)]
@@ -1,9 +1,15 @@
-from scipy.interpolate import interp1d
-from numpy import array
+from scipy.interpolate import CubicSpline
 
 
 def interpolate(t_grid, x_grid):
-    n = x_grid.shape[1]
-    spline = array([interp1d(t_grid, x_grid[:, j], kind='cubic') for j in range(n)])
+    """
+    Кубический сплайн для всех компонент x_grid сразу
+    :return: векторнозначный кусочно-полиномиальный объект, spline(t) имеет форму (len(t), n)
+    """
+    # Сплайн строится по возрастающей сетке, обратная сетка разворачивается
+    if t_grid[0] > t_grid[-1]:
+        t_grid = t_grid[::-1]
+        x_grid = x_grid[::-1]
+    spline = CubicSpline(t_grid, x_grid, axis=0)
 
     return spline
@@ -0,0 +1,85 @@
+from numerical.MatrixExponential import calculate_basis_weights
+from instrumentation.Telemetry import count
+from math import factorial
+from numpy import array, zeros, empty, eye, asarray, einsum, diff, searchsorted, minimum
+from scipy.sparse import csr_matrix, bmat, eye as sparse_eye, issparse
+from scipy.sparse.linalg import expm_multiply
+
+
+def calculate_adjoint_segment_data(A, B, W, nodes, order: int, previous: dict = None) -> dict:
+    """
+    Проекции интегралов по отрезкам через сопряжённую систему:
+    Z_k = exp(A'(T - t_(k+1)))W' (форма (n, p)) переносится от последнего отрезка к первому действием экспоненты
+    разреженной матрицы [[A', Z_k, 0, ...], [0, 0, I, ...], ..., [0, 0, 0, ...]], верхний блок которой даёт
+    одновременно Z_(k-1) и интегралы int_(t_k)^(t_(k+1)) (exp(A'(T-t))W'(t-t_k)^j/j!) dt.
+    Время пропорционально nnz(A)*p на отрезок; плотные матрицы размера n x n не строятся
+    :param W: массив формы (p, n) с небольшим количеством строк p (например, строки H и c)
+    :param previous: данные другого разбиения того же отрезка [0, T] с теми же A, B, W и order: отрезки,
+                     входящие в оба разбиения (например, не поделённые при измельчении), не пересчитываются
+    :return: словарь: nodes --- узлы, Z --- массив формы (N + 1, n, p) значений Z в узлах,
+             BL --- массив формы (N, order, r, p), [k, j, i] = W*int_(t_k)^(t_(k+1)) (exp(A(T-t))b_i*(t-t_k)^j) dt
+    """
+    n = A.shape[0]
+    W = W.toarray() if issparse(W) else asarray(W, dtype=float)
+    p = W.shape[0]
+    r = B.shape[1]
+    nodes = asarray(nodes, dtype=float)
+    N = len(nodes) - 1
+    steps = diff(nodes)
+
+    # Отрезки другого разбиения: k-й отрезок совпадает с positions[k]-м, если оба его конца --- соседние узлы
+    reused = zeros(N, dtype=bool)
+    if previous is not None and previous['BL'].shape[1] >= order:
+        positions = searchsorted(previous['nodes'], nodes)
+        present = previous['nodes'][minimum(positions, len(previous['nodes']) - 1)] == nodes
+        reused = present[:-1] & present[1:] & (diff(positions) == 1)
+
+    # Цепочка интеграторов для степеней (t - t_k)^j/j!
+    chain = csr_matrix((order * p, order * p))
+    if order > 1:
+        chain = bmat([[None, sparse_eye((order - 1) * p)], [csr_matrix((p, p)), None]], format='csr')
+    transposed = csr_matrix(A).T.tocsr()
+    factorials = array([factorial(j) for j in range(order)])
+
+    # Начальные векторы: (Z_k, 0) для переноса и (0, e) для каждой степени j и строки W
+    start = zeros((n + order * p, (order + 1) * p))
+    start[n:, p:] = eye(order * p)
+
+    Z = empty((N + 1, n, p))
+    BL = empty((N, order, r, p))
+    Z[N] = W.T
+    for k in reversed(range(N)):
+        if reused[k]:
+            count('reused_segments')
+            Z[k] = previous['Z'][positions[k]]
+            BL[k] = previous['BL'][positions[k], :order]
+            continue
+
+        coupling = zeros((n, order * p))
+        coupling[:, :p] = Z[k + 1]
+        augmented = bmat([[transposed, csr_matrix(coupling)], [None, chain]], format='csr')
+
+        start[:n, :p] = Z[k + 1]
+        count('expm_actions')
+        result = expm_multiply(augmented * steps[k], start)[:n]
+
+        # L[j] = int_(t_k)^(t_(k+1)) (exp(A'(T-t))W'(t-t_k)^j) dt и его проекции на столбцы B
+        L = result[:, p:].reshape(n, order, p).transpose(1, 0, 2) * factorials[:, None, None]
+        BL[k] = array([B.T.dot(L[j]) for j in range(order)])
+        Z[k] = result[:, :p]
+
+    # Узлы копируются: массив вызывающего кода может измениться после записи в кэш
+    return {'nodes': nodes.copy(), 'Z': Z, 'BL': BL}
+
+
+def get_adjoint_segment_integrals(data: dict, order: int, basis: str = 'global'):
+    """
+    Проекции интегралов по функциям базиса из данных calculate_adjoint_segment_data
+    :param basis: базис управления на отрезках (см. calculate_basis_weights)
+    :return: массив формы (r, N, order, p), [i, k, o] = W*int_(t_k)^(t_(k+1)) (exp(A(T-t))b_i*phi_o(t)) dt
+    """
+    # Разложение функций базиса по степеням (t - t_k)^j
+    weights = calculate_basis_weights(data['nodes'], order, basis)
+
+    return einsum('koj,kjip->ikop', weights, data['BL'][:, :order])
+
@@ -0,0 +1,137 @@
+from instrumentation.Telemetry import count
+from math import factorial, comb
+from numpy import zeros, eye, empty, append, column_stack, einsum, asarray, diff, unique, around, arange
+from scipy.linalg import expm
+from scipy.sparse import issparse, csr_matrix, bmat
+from scipy.sparse.linalg import expm_multiply
+
+
+def calculate_free_movement(A, C, x0, T: float):
+    """
+    Точное решение уравнения dx/dt = Ax + C, x(0) = x0 в точке T
+    :return: x(T) = exp(AT)x0 + int_0^T(exp(A(T-t))C)dt
+    """
+    n = A.shape[0]
+
+    # Для разреженной A вычисляется только действие экспоненты на вектор, сама экспонента не строится
+    if issparse(A):
+        augmented = bmat([[csr_matrix(A), csr_matrix(asarray(C, dtype=float).reshape(n, 1))],
+                          [None, csr_matrix((1, 1))]], format='csr')
+        count('expm_actions')
+
+        return expm_multiply(augmented * T, append(x0, 1.))[:n]
+
+    # Расширенная матрица [[A, C], [0, 0]]: exp от неё переносит вектор (x, 1)
+    augmented = zeros((n + 1, n + 1))
+    augmented[:n, :n] = A
+    augmented[:n, n] = C
+
+    count('expm_calls')
+
+    return expm(augmented * T).dot(append(x0, 1.))[:n]
+
+
+def calculate_local_integrals(A, B, h: float, order: int):
+    """
+    Интегралы по одному отрезку длины h через экспоненту блочной матрицы (метод Ван Лоана)
+    :return: 1) Phi --- матрица перехода exp(Ah),
+             2) L --- массив формы (order, n, r), L[j] = int_0^h(exp(A(h-s))B*s^j)ds
+    """
+    n = len(A)
+    r = B.shape[1]
+
+    # Расширенная матрица [[A, B, 0, ...], [0, 0, I, ...], ..., [0, 0, 0, ...]]:
+    # цепочка интеграторов порождает в верхней строке блоков int_0^h(exp(A(h-s))B*s^j/j!)ds
+    size = n + order * r
+    augmented = zeros((size, size))
+    augmented[:n, :n] = A
+    augmented[:n, n:n + r] = B
+    for j in range(order - 1):
+        augmented[n + j * r:n + (j + 1) * r, n + (j + 1) * r:n + (j + 2) * r] = eye(r)
+
+    count('expm_calls')
+    E = expm(augmented * h)
+
+    L = empty((order, n, r))
+    for j in range(order):
+        L[j] = factorial(j) * E[:n, n + j * r:n + (j + 1) * r]
+
+    return E[:n, :n], L
+
+
+def calculate_shift_weights(t0, order: int):
+    """
+    Коэффициенты пересчёта степеней при сдвиге: (t0 + s)^o = sum_j weights[..., o, j]*s^j
+    :param t0: момент времени или массив моментов
+    """
+    t0 = asarray(t0, dtype=float)
+    weights = zeros(t0.shape + (order, order))
+    for o in range(order):
+        for j in range(o + 1):
+            weights[..., o, j] = comb(o, j) * t0 ** (o - j)
+
+    return weights
+
+
+def calculate_basis_weights(nodes, order: int, basis: str = 'global'):
+    """
+    Разложение функций базиса на отрезках по степеням s = t - t_k: phi_o(t_k + s) = sum_j weights[k, o, j]*s^j.
+    Базис 'global' --- мономы t^o, 'local' --- мономы tau^o нормированного времени tau = (t - t_k)/h_k из [0, 1]
+    :return: массив формы (N, order, order)
+    """
+    nodes = asarray(nodes, dtype=float)
+    if basis == 'global':
+        return calculate_shift_weights(nodes[:-1], order)
+    if basis == 'local':
+        scales = diff(nodes)[:, None] ** -arange(order, dtype=float)
+        weights = zeros((len(nodes) - 1, order, order))
+        weights[:, arange(order), arange(order)] = scales
+
+        return weights
+
+    raise ValueError('Unknown basis {}'.format(basis))
+
+
+def calculate_segment_integrals(A, B, nodes, order: int, basis: str = 'global'):
+    """
+    Точное вычисление интегралов int_(t_k)^(t_(k+1)) (exp(A(T-t))b_i*phi_o(t)) dt, T = nodes[-1],
+    для всех входов i, отрезков k и функций базиса phi_o (t^o или ((t - t_k)/h_k)^o) одним вызовом
+    :param nodes: возрастающий массив узлов t_0 = 0, ..., t_N = T
+    :return: D --- массив формы (r, N, order, n)
+    """
+    n = len(A)
+    r = B.shape[1]
+    nodes = asarray(nodes, dtype=float)
+    N = len(nodes) - 1
+    steps = diff(nodes)
+
+    # Экспоненты вычисляются один раз для каждой различной длины отрезка
+    keys, step_indices = unique(around(steps, 12), return_inverse=True)
+    local = [calculate_local_integrals(A, B, steps[step_indices == index][0], order) for index in range(len(keys))]
+
+    D = empty((r, N, order, n))
+    # Разложение функций базиса по степеням s = t - t_k, например (t_k + s)^o = sum_j C(o, j)*t_k^(o-j)*s^j
+    weights = calculate_basis_weights(nodes, order, basis)
+    # Матрица перехода exp(A(T - t_(k+1))) накапливается от последнего отрезка к первому
+    propagator = eye(n)
+    for k in reversed(range(N)):
+        Phi, L = local[step_indices[k]]
+        W = weights[k].dot(L.reshape(order, n * r)).reshape(order, n, r)
+        D[:, k, :, :] = propagator.dot(W).transpose(2, 1, 0)
+        propagator = propagator.dot(Phi)
+
+    return D
+
+
+def calculate_segment_movement(A, B, C, x0, coefficients, h: float):
+    """
+    Точное решение уравнения dx/dt = Ax + Bu + C на отрезке [0, h] при полиномиальном управлении
+    u_i(s) = sum_o coefficients[i, o]*s^o
+    :return: x(h)
+    """
+    r, order = coefficients.shape
+
+    # Столбец C добавляется к B как вход с постоянным единичным управлением
+    Phi, L = calculate_local_integrals(A, column_stack((B, C)), h, order)
+
+    return Phi.dot(x0) + einsum('onr,ro->n', L[:, :, :r], coefficients) + L[0, :, r]
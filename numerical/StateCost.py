@@ -0,0 +1,136 @@
+from numerical.MatrixExponential import calculate_basis_weights
+from numerical.Cache import PrecomputationCache, calculate_key, get_default_cache
+from instrumentation.Telemetry import stage, count
+from math import factorial
+from numpy import zeros, eye, empty, asarray, diff, unique, around, sqrt
+from numpy.linalg import eigh
+from scipy.linalg import expm
+from scipy.sparse import issparse
+
+
+def build_augmented_matrix(A, B, C, order: int):
+    """
+    Матрица системы для состояния zeta = (x, y_0, ..., y_(order-1), 1) на отрезке: y_j = d^j u/ds^j,
+    dx/ds = Ax + By_0 + C, dy_j/ds = y_(j+1), поэтому zeta(s) = exp(Ms)zeta(0), где y_j(0) = j!*a_j
+    для управления u(s) = sum_j a_j*s^j
+    """
+    n = A.shape[0]
+    r = B.shape[1]
+
+    size = n + order * r + 1
+    augmented = zeros((size, size))
+    augmented[:n, :n] = A
+    augmented[:n, n:n + r] = B
+    augmented[:n, -1] = C
+    for j in range(order - 1):
+        augmented[n + j * r:n + (j + 1) * r, n + (j + 1) * r:n + (j + 2) * r] = eye(r)
+
+    return augmented
+
+
+def calculate_local_state_cost(augmented, Q, h: float):
+    """
+    Матрица перехода и матрица Грама int_0^h(exp(M's)*blkdiag(Q, 0)*exp(Ms))ds одной экспонентой
+    блочной матрицы [[-M', blkdiag(Q, 0)], [0, M]] (метод Ван Лоана)
+    :return: 1) transition --- exp(Mh),
+             2) gram --- симметричная матрица Грама
+    """
+    size = len(augmented)
+    n = len(Q)
+
+    block = zeros((2 * size, 2 * size))
+    block[:size, :size] = -augmented.T
+    block[:n, size:size + n] = Q
+    block[size:, size:] = augmented
+
+    count('expm_calls')
+    E = expm(block * h)
+    transition = E[size:, size:]
+    gram = transition.T.dot(E[:size, size:])
+
+    return transition, (gram + gram.T) / 2
+
+
+def factorize_gram_matrix(gram, tolerance: float = 1e-12):
+    """
+    Малоранговое разложение gram = F'F по собственным числам, не меньшим tolerance от наибольшего
+    (отрицательные собственные числа ошибок округления отбрасываются)
+    :return: F --- массив формы (rank, size)
+    """
+    values, vectors = eigh(gram)
+    kept = values > tolerance * max(values.max(), 0.)
+
+    return sqrt(values[kept])[:, None] * vectors[:, kept].T
+
+
+def calculate_state_cost_blocks(A, B, C, Q, nodes, order: int, cache: PrecomputationCache = None,
+                                basis: str = 'global'):
+    """
+    Данные для члена int_0^T(x(t)'*Q*x(t))dt: на отрезке k с состоянием x_k = x(t_k) и коэффициентами
+    p[i, k, o] управления sum_o p[i, k, o]*phi_o(t) (базис phi_o см. calculate_basis_weights)
+    вектор zeta_k = (x_k, S_k*p_k, 1) определяет x(t_(k+1)) = transitions[k]*zeta_k
+    и int_(t_k)^(t_(k+1)) (x(t)'*Q*x(t)) dt = |factors[k]*zeta_k|^2.
+    Экспоненты вычисляются один раз для каждой различной длины отрезка, поэтому вычисление линейно по N
+    (для разреженных A, B и Q строятся плотные блоки размера n + order*r + 1).
+    При Q = None вычисляются только матрицы перехода (factors = None)
+    :return: 1) transitions --- массив формы (N, n, size), size = n + order*r + 1,
+             2) factors --- массив формы (N, size, size) (строки после ранга нулевые),
+             3) selections --- массив формы (N, order*r, r*order), S_k: переход от коэффициентов p[i, k, o]
+                (в порядке i*order + o) к начальным значениям y_j[i] (в порядке j*r + i)
+    """
+    nodes = asarray(nodes, dtype=float)
+    if cache is None:
+        cache = get_default_cache()
+
+    key = calculate_key('state_cost', A, B, C, Q, nodes, order, basis)
+    entry = cache.get(key)
+    count('cache_hits' if entry is not None else 'cache_misses')
+    if entry is not None:
+        return entry['transitions'], entry.get('factors'), entry['selections']
+
+    with stage('precompute'):
+        A, B = [M.toarray() if issparse(M) else asarray(M, dtype=float) for M in (A, B)]
+        if Q is not None:
+            Q = Q.toarray() if issparse(Q) else asarray(Q, dtype=float)
+        n = A.shape[0]
+        r = B.shape[1]
+        N = len(nodes) - 1
+        steps = diff(nodes)
+
+        augmented = build_augmented_matrix(A, B, asarray(C, dtype=float), order)
+        size = len(augmented)
+
+        keys, step_indices = unique(around(steps, 12), return_inverse=True)
+        local = []
+        for index in range(len(keys)):
+            h = steps[step_indices == index][0]
+            if Q is None:
+                count('expm_calls')
+                local.append((expm(augmented * h)[:n], None))
+                continue
+            transition, gram = calculate_local_state_cost(augmented, Q, h)
+            factor = zeros((size, size))
+            F = factorize_gram_matrix(gram)
+            factor[:len(F)] = F
+            local.append((transition[:n], factor))
+
+        transitions = empty((N, n, size))
+        factors = None if Q is None else empty((N, size, size))
+        for k in range(N):
+            transitions[k] = local[step_indices[k]][0]
+            if factors is not None:
+                factors[k] = local[step_indices[k]][1]
+
+        # y_j[i](0) = j!*sum_o weights[k, o, j]*p[i, k, o], например weights[k, o, j] = C(o, j)*t_k^(o-j)
+        weights = calculate_basis_weights(nodes, order, basis)
+        selections = zeros((N, order * r, r * order))
+        for j in range(order):
+            for i in range(r):
+                selections[:, j * r + i, i * order:(i + 1) * order] = factorial(j) * weights[:, :, j]
+
+    entry = {'transitions': transitions, 'selections': selections}
+    if factors is not None:
+        entry['factors'] = factors
+    cache.put(key, entry)
+
+    return transitions, factors, selections
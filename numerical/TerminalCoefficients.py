@@ -0,0 +1,160 @@
+from numerical.MatrixExponential import calculate_free_movement, calculate_segment_integrals, calculate_shift_weights
+from numerical.KrylovExponential import calculate_adjoint_segment_data, get_adjoint_segment_integrals
+from numerical.Cache import PrecomputationCache, calculate_key, get_default_cache
+from instrumentation.Telemetry import stage, count
+from numpy import linspace, empty, asarray, vstack, einsum, diff, arange
+from scipy.sparse import issparse
+
+
+def calculate_terminal_coefficients_by_quadrature(A, B, C, x0, nodes, order):
+    """
+    Вычисление коэффициентов терминальных ограничений через решение ОДУ на сетке,
+    интерполяцию и численное интегрирование
+    """
+    # scipy.integrate и scipy.interpolate нужны только этому способу и долго импортируются
+    from numerical.DifferentialEquation import solve_linear_differential_equation
+    from numerical.Interpolation import interpolate
+    from numerical.DefiniteIntegral import integrate, integrate_segments
+
+    n = len(A)
+    r = B.shape[1]
+    T = nodes[-1]
+    N = len(nodes) - 1
+
+    grid_size = 501
+    straight_grid = linspace(0, T, grid_size)
+    reverse_grid = linspace(T, 0, grid_size)
+
+    z_0 = solve_linear_differential_equation(A, x0, straight_grid)
+
+    zc = solve_linear_differential_equation(-A, C, reverse_grid)
+    spline_zc = interpolate(reverse_grid, zc)
+    int_zc = integrate(spline_zc, 0, T)
+
+    # Решение уравнения при нулевом управлении: dx/dt = Ax + C в точке T
+    xT = z_0[-1, :] + int_zc
+
+    D = empty((r, N, order, n))
+    for i in range(r):
+        zb = solve_linear_differential_equation(-A, B[:, i], reverse_grid)
+        for o in range(order):
+            spline_zb = interpolate(reverse_grid, zb * reverse_grid[:, None] ** o)
+            # Выражение int_(t_k)^(t_(k+1)) (exp(A(T-t))b_i*t^o) dt сразу для всех k
+            D[i, :, o] = integrate_segments(spline_zb, nodes)
+
+    return xT, D
+
+
+def convert_to_local_basis(D, nodes):
+    """
+    Переход от интегралов с мономами t^o к интегралам с мономами ((t - t_k)/h_k)^j:
+    ((t - t_k)/h_k)^j = sum_o C(j, o)*(-t_k)^(j-o)*t^o/h_k^j
+    """
+    order = D.shape[2]
+    weights = calculate_shift_weights(-asarray(nodes[:-1], dtype=float), order)
+    weights = weights * (diff(nodes)[:, None, None] ** -arange(order, dtype=float)[:, None])
+
+    return einsum('kjo,ikon->ikjn', weights, D)
+
+
+def calculate_terminal_coefficients(A, B, C, x0, nodes, order, method='expm', cache: PrecomputationCache = None,
+                                    basis: str = 'global'):
+    """
+    Вычисление данных для терминальных ограничений Hx(T) = g
+    :param nodes: возрастающий массив узлов разбиения t_0 = 0, ..., t_N = T
+    :param method: 'expm' --- точное вычисление через экспоненты блочных матриц,
+                   'quadrature' --- решение ОДУ на сетке и численное интегрирование
+    :param cache: кэш предвычисленных данных (по умолчанию --- общий кэш из numerical.Cache)
+    :param basis: базис управления на отрезках: 'global' --- мономы t^o, 'local' --- мономы ((t - t_k)/h_k)^o
+    :return: 1) xT --- решение уравнения dx/dt = Ax + C при нулевом управлении в точке T,
+             2) D --- массив формы (r, N, order, n),
+                D[i, k, o] = int_(t_k)^(t_(k+1)) (exp(A(T-t))b_i*phi_o(t)) dt для функций базиса phi_o
+    """
+    nodes = asarray(nodes, dtype=float)
+    T = float(nodes[-1])
+
+    if method not in ('expm', 'quadrature'):
+        raise ValueError('Unknown method of terminal coefficients calculation: {}'.format(method))
+
+    if cache is None:
+        cache = get_default_cache()
+
+    # xT и D кэшируются раздельно: D не зависит от x0 и C, а D младших порядков
+    # получается срезом D старшего порядка, поэтому общий для всех режимов
+    free_key = calculate_key('free', A, C, x0, T, method)
+    segments_key = calculate_key('segments', A, B, nodes, method, basis)
+    free_entry = cache.get(free_key)
+    segments_entry = cache.get(segments_key)
+    if segments_entry is not None and segments_entry['D'].shape[2] < order:
+        segments_entry = None
+
+    count('cache_hits' if free_entry is not None and segments_entry is not None else 'cache_misses')
+    if free_entry is None or segments_entry is None:
+        with stage('precompute'):
+            if method == 'expm':
+                xT = calculate_free_movement(A, C, x0, T) if free_entry is None else None
+                D = calculate_segment_integrals(A, B, nodes, order, basis) if segments_entry is None else None
+            else:
+                xT, D = calculate_terminal_coefficients_by_quadrature(A, B, C, x0, nodes, order)
+                if basis == 'local':
+                    D = convert_to_local_basis(D, nodes)
+
+        if free_entry is None:
+            free_entry = {'xT': xT}
+            cache.put(free_key, free_entry)
+        if segments_entry is None:
+            segments_entry = {'D': D}
+            cache.put(segments_key, segments_entry)
+
+    return free_entry['xT'], segments_entry['D'][:, :, :order]
+
+
+def calculate_terminal_projections(A, B, C, x0, H, c, nodes, order, method='expm', cache: PrecomputationCache = None,
+                                   basis: str = 'global'):
+    """
+    Данные терминальных ограничений и целевой функции, спроецированные на строки H и c. Для разреженной A
+    (method = 'expm') проекции вычисляются через сопряжённую систему действиями экспонент на m + 1 векторов,
+    без массивов размера n x n и без D
+    :return: 1) HxT --- H*xT,
+             2) HD --- массив формы (r, N, order, m), HD[i, k, o] = H*D[i, k, o],
+             3) cD --- массив формы (r, N, order), cD[i, k, o] = c*D[i, k, o]
+    """
+    nodes = asarray(nodes, dtype=float)
+    m = H.shape[0]
+    W = vstack((H.toarray() if issparse(H) else H, asarray(c, dtype=float)))
+
+    if not issparse(A) or method != 'expm':
+        xT, D = calculate_terminal_coefficients(A, B, C, x0, nodes, order, method, cache, basis)
+        WxT = W.dot(xT)
+        WD = D.dot(W.T)
+
+        return WxT[:m], WD[..., :m], WD[..., m]
+
+    if cache is None:
+        cache = get_default_cache()
+
+    free_key = calculate_key('free', A, C, x0, float(nodes[-1]), method)
+    segments_key = calculate_key('adjoint', A, B, W, nodes, method, basis)
+    free_entry = cache.get(free_key)
+    segments_entry = cache.get(segments_key)
+    if segments_entry is not None and segments_entry['WD'].shape[2] < order:
+        segments_entry = None
+
+    count('cache_hits' if free_entry is not None and segments_entry is not None else 'cache_misses')
+    if free_entry is None or segments_entry is None:
+        with stage('precompute'):
+            if free_entry is None:
+                free_entry = {'xT': calculate_free_movement(A, C, x0, nodes[-1])}
+                cache.put(free_key, free_entry)
+            if segments_entry is None:
+                # Данные последнего разбиения [0, T] для этих A, B, W: при измельчении (см. AdaptiveControl)
+                # пересчитываются только новые отрезки
+                data_key = calculate_key('adjoint_data', A, B, W, float(nodes[-1]), order, method)
+                data = calculate_adjoint_segment_data(A, B, W, nodes, order, cache.get(data_key))
+                cache.put(data_key, data)
+                segments_entry = {'WD': get_adjoint_segment_integrals(data, order, basis)}
+                cache.put(segments_key, segments_entry)
+
+    WD = segments_entry['WD'][:, :, :order]
+
+    return H.dot(free_entry['xT']), WD[..., :m], WD[..., m]
@@ -1,35 +1,183 @@
-from matplotlib import pyplot as plt
-
-
-def plot(t, x, u):
-
-    plt.subplot(2, 1, 1)
-    ax = plt.gca()
-
-    ax.annotate('$t$', xy=(1., -0.06), ha='left', va='top', xycoords='axes fraction')
-    ax.annotate('$u_1(t),~u_2(t)$', xy=(0.0, 1.12), xytext=(-15, 2), ha='left',
-                va='top', xycoords='axes fraction',
-                textcoords='offset points')
-    plt.title('Оптимальное управление')
-    # plt.title('Optimal Control')
-    plt.grid(True)
-    plt.xticks(list(range(0, 22, 2)))
-    plt.plot(t, u[:, 0], label='$u_1(t)$')
-    plt.plot(t, u[:, 1], label='$u_2(t)$')
-    plt.legend()
-
-    plt.subplot(2, 1, 2)
-    ax = plt.gca()
-    ax.annotate(r'$\xi(t)$', xy=(0.98, -0.06), ha='left', va='top',
-                xycoords='axes fraction')
-    ax.annotate(r'$\eta(t)$', xy=(0.0, 1.12), xytext=(-15, 2), ha='left',
-                va='top', xycoords='axes fraction',
-                textcoords='offset points')
-    plt.title('Фазовый портрет')
-    # plt.title('Phase Portrait')
-    plt.grid(True)
-    plt.plot(x[:, 0], x[:, 2])
-
-    # plt.style.use('grayscale')
-    plt.subplots_adjust(hspace=0.5)
+from instrumentation.Telemetry import stage
+from numpy import asarray, arange, concatenate, unique, load, minimum, linspace, searchsorted, lexsort, \
+    flatnonzero, diff, append
+from matplotlib.figure import Figure
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import os
+
+
+def get_decimation_indices(t, values, bins: int):
+    """
+    Индексы точек прореживания: в каждом из bins столбцов (равных по времени частей отрезка [t[0], t[-1]],
+    то есть пикселей по оси t при любой сетке) остаются точки минимума и максимума каждого столбца values,
+    а также первая и последняя точки ряда, так что ломаная по ним в пикселях не отличается от исходной
+    :param t: неубывающий массив моментов формы (L,)
+    :param values: ряд формы (L,) или (L, k)
+    :return: возрастающий массив индексов
+    """
+    t = asarray(t, dtype=float)
+    values = asarray(values)
+    values = values.reshape(len(values), -1)
+    length = len(values)
+    if length <= 2 * bins:
+        return arange(length)
+
+    # Номера столбцов не убывают, поэтому точки каждого столбца идут подряд: [starts[j], ends[j]]
+    columns = minimum(searchsorted(linspace(t[0], t[-1], bins + 1), t, side='right') - 1, bins - 1)
+    starts = flatnonzero(diff(columns, prepend=-1))
+    ends = append(starts[1:], length) - 1
+    indices = [[0, length - 1]]
+    for values_column in values.T:
+        # Сортировка по столбцу, затем по значению: первая и последняя точки столбца --- минимум и максимум
+        order = lexsort((values_column, columns))
+        indices += [order[starts], order[ends]]
+
+    return unique(concatenate(indices))
+
+
+def decimate(t, values, bins: int):
+    """
+    Прореживание ряда минимумами и максимумами по столбцам (см. get_decimation_indices)
+    """
+    indices = get_decimation_indices(t, values, bins)
+
+    return asarray(t)[indices], asarray(values)[indices]
+
+
+def draw(figure: Figure, t, x, u, states=None, phase=None, bins: int = None) -> None:
+    """
+    Графики управления, состояния и фазового портрета на фигуре
+    :param x: состояние, массив формы (len(t), n)
+    :param u: управление, массив формы (len(t), r)
+    :param states: номера компонент состояния на графике от времени (по умолчанию все; пустой список ---
+                   без этого графика)
+    :param phase: пара номеров компонент состояния для фазового портрета (по умолчанию без него)
+    :param bins: количество столбцов прореживания (по умолчанию ряды не прореживаются)
+    """
+    t = asarray(t)
+    x = asarray(x).reshape(len(t), -1)
+    u = asarray(u).reshape(len(t), -1)
+    states = range(x.shape[1]) if states is None else list(states)
+    panels = 1 + bool(len(states)) + (phase is not None)
+    axes = figure.subplots(panels, 1, squeeze=False)[:, 0]
+
+    def reduce(values):
+        return (t, values) if bins is None else decimate(t, values, bins)
+
+    def set_time_axis(ax, title: str):
+        ax.set_title(title)
+        ax.annotate('$t$', xy=(1., -0.06), ha='left', va='top', xycoords='axes fraction')
+        ax.grid(True)
+
+    ax = axes[0]
+    set_time_axis(ax, 'Оптимальное управление')
+    t_u, u_values = reduce(u)
+    for i in range(u.shape[1]):
+        ax.plot(t_u, u_values[:, i], label='$u_{{{}}}(t)$'.format(i + 1))
+    # Поиск лучшего места легенды перебирает точки всех линий, поэтому место задано
+    ax.legend(loc='upper right')
+
+    if len(states):
+        ax = axes[1]
+        set_time_axis(ax, 'Состояние')
+        t_x, x_values = reduce(x[:, states])
+        for column, i in enumerate(states):
+            ax.plot(t_x, x_values[:, column], label='$x_{{{}}}(t)$'.format(i + 1))
+        ax.legend(loc='upper right')
+
+    if phase is not None:
+        first, second = phase
+        ax = axes[-1]
+        ax.set_title('Фазовый портрет')
+        ax.set_xlabel('$x_{{{}}}$'.format(first + 1))
+        ax.set_ylabel('$x_{{{}}}$'.format(second + 1))
+        ax.grid(True)
+        _, values = reduce(x[:, [first, second]])
+        ax.plot(values[:, 0], values[:, 1])
+
+    figure.subplots_adjust(hspace=0.5)
+
+
+def create_figure(t, x, u, size=(8., 6.), dpi: int = 100, decimation: bool = True, **options) -> Figure:
+    """
+    Фигура с графиками без pyplot: не зависит от интерактивного режима и глобального состояния matplotlib
+    и может строиться в нескольких процессах. Ряды прореживаются до ширины фигуры в пикселях
+    :param size: размер фигуры в дюймах
+    :param options: параметры draw (states, phase)
+    """
+    figure = Figure(figsize=size, dpi=dpi)
+    draw(figure, t, x, u, bins=int(size[0] * dpi) if decimation else None, **options)
+
+    return figure
+
+
+def plot(t, x, u, **options) -> None:
+    """
+    Интерактивный вывод графиков (см. draw)
+    """
+    from matplotlib import pyplot as plt
+
+    figure = plt.figure()
+    draw(figure, t, x, u, **options)
     plt.show()
+
+
+def load_results(source):
+    """
+    Траектория t, x, u из словаря массивов или файла результатов run.py (.npz или каталог файлов .npy,
+    которые открываются без чтения в память)
+    """
+    if isinstance(source, dict):
+        return source['t'], source['x'], source['u']
+    if source.endswith('.npz'):
+        with load(source, allow_pickle=False) as file:
+            return file['t'], file['x'], file['u']
+
+    return tuple(load(os.path.join(source, name + '.npy'), mmap_mode='r') for name in ('t', 'x', 'u'))
+
+
+def render(path: str, t, x, u, **options) -> str:
+    """
+    Запись графиков в файл; формат (PNG, SVG, PDF) определяется расширением
+    :param options: параметры create_figure и draw
+    """
+    create_figure(t, x, u, **options).savefig(path)
+
+    return path
+
+
+def render_results(path: str, source, options: dict) -> str:
+    return render(path, *load_results(source), **options)
+
+
+def render_many(tasks, workers: int = None, **options) -> list:
+    """
+    Запись графиков набора траекторий в файлы. Чтобы не передавать процессам массивы, траектории удобно
+    задавать файлами результатов; одновременно поставлено не более 2*workers задач, поэтому память
+    не зависит от размера набора
+    :param tasks: пары (файл графиков, траектория): траектория --- словарь с t, x, u или файл результатов
+                  (см. load_results)
+    :param workers: количество процессов (по умолчанию графики строятся в текущем процессе)
+    :param options: параметры create_figure и draw, общие для всех графиков
+    :return: список записанных файлов в порядке завершения
+    """
+    paths = []
+    with stage('render'):
+        if workers is None:
+            for path, source in tasks:
+                paths.append(render_results(path, source, options))
+
+            return paths
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = set()
+            for path, source in tasks:
+                pending.add(executor.submit(render_results, path, source, options))
+                if len(pending) >= 2 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    paths += [future.result() for future in done]
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                paths += [future.result() for future in done]
+
+    return paths
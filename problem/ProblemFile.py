@@ -0,0 +1,74 @@
+from problem.ProblemStatement import Problem
+from numpy import load, savez, asarray, ndarray
+import json
+
+
+# Параметры, задаваемые числами и строками, а не массивами
+SCALARS = {'T': float, 'N': int, 'basis': str, 'formulation': str}
+
+
+def convert_parameters(parameters: dict) -> dict:
+    """
+    Приведение считанных значений к типам параметров Problem: массивы --- к numpy, числа и строки ---
+    к типам из SCALARS (в .npz они хранятся массивами нулевой размерности)
+    """
+    converted = {}
+    for name, value in parameters.items():
+        if value is None:
+            continue
+        if name in SCALARS:
+            converted[name] = SCALARS[name](value.item() if isinstance(value, ndarray) else value)
+        else:
+            converted[name] = asarray(value, dtype=float)
+
+    return converted
+
+
+def load_problem(path: str) -> Problem:
+    """
+    Чтение постановки задачи из файла .npz (массивы с именами параметров Problem) или .json (объект
+    с теми же ключами, матрицы --- вложенными списками). Незаданные параметры берутся из Problem
+    """
+    if path.endswith('.npz'):
+        with load(path, allow_pickle=False) as file:
+            parameters = {name: file[name] for name in file.files}
+    elif path.endswith('.json'):
+        with open(path) as file:
+            parameters = json.load(file)
+    else:
+        raise ValueError('Unknown problem file format: {}'.format(path))
+
+    return Problem(**convert_parameters(parameters))
+
+
+def get_parameters(P: Problem) -> dict:
+    """
+    Параметры постановки задачи словарём массивов numpy, чисел и строк (разреженные матрицы --- плотными)
+    """
+    parameters = {}
+    for name in ('A', 'B', 'C', 'L1', 'L2', 'x0', 'H', 'g', 'Q', 'R', 'd', 'c', 'nodes'):
+        value = getattr(P, name)
+        if value is not None:
+            parameters[name] = asarray(value.toarray() if hasattr(value, 'toarray') else value, dtype=float)
+    parameters.update(T=float(P.T), N=int(P.N), basis=P.basis, formulation=P.formulation)
+
+    return parameters
+
+
+def convert_to_json(parameters: dict) -> dict:
+    return {name: value.tolist() if isinstance(value, ndarray) else value for name, value in parameters.items()}
+
+
+def save_problem(P: Problem, path: str) -> None:
+    """
+    Запись постановки задачи в файл .npz или .json
+    """
+    parameters = get_parameters(P)
+
+    if path.endswith('.npz'):
+        savez(path, **parameters)
+    elif path.endswith('.json'):
+        with open(path, 'w') as file:
+            json.dump(convert_to_json(parameters), file, indent=1)
+    else:
+        raise ValueError('Unknown problem file format: {}'.format(path))
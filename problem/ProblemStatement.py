@@ -1,14 +1,20 @@
 from typing import Tuple
-from numpy import array
+from numpy import array, linspace, diff
+import logging
+
+
+logger = logging.getLogger(__name__)
 
 
 class Problem(object):
 
-    def __init__(self) -> None:
+    def __init__(self, **parameters) -> None:
         """
         Задание параметров задачи
+        :param parameters: значения параметров, заменяющие заданные ниже (A, B, C, L1, L2, x0, H, g, Q, R, d, c, T, N,
+                           nodes, basis, formulation)
         """
-        # Задание уравнения dx/dt = Ax + Bu + C
+        # Задание уравнения dx/dt = Ax + Bu + C (матрицы A, B, H и Q могут быть разреженными матрицами scipy.sparse)
         self.A = array([
             [0., 1., 0., 0.],
             [1., 0., 0., -3.],
@@ -39,7 +45,7 @@ class Problem(object):
 
         # Целевая функция в виде
         # int_0^T (x(t)'*Q*x(t) + u(t)'*R*u(t) + d*|u(t)|) dt + c*x(T) --> min
-        # Сейчас квадратичная форма x(t)'*Q*x(t) не учитывается в ЦФ
+        # Квадратичная форма x(t)'*Q*x(t) учитывается через матрицы Грама отрезков (numerical.StateCost)
         # Член с модулем d*|u(t)| не учитывается в управлении сплайнами
         self.Q = array([
             [0., 0., 0., 0.],
@@ -60,6 +66,27 @@ class Problem(object):
         # Количество разбиений отрезка управления
         self.N = 50
 
+        # Узлы разбиения 0 = t_0 < t_1 < ... < t_N = T (по умолчанию равномерное разбиение Tk/N)
+        self.nodes = None
+
+        # Базис полиномов управления на отрезках: 'global' --- мономы t^o,
+        # 'local' --- мономы нормированного времени ((t - t_k)/h_k)^o (лучше обусловлен при больших T)
+        self.basis = 'global'
+
+        # Формулировка модели: 'condensed' --- без переменных состояния, 'shooting' --- с состояниями в узлах
+        # и уравнениями перехода по отрезкам, 'auto' --- выбор по размерам задачи (control.MatrixModel.get_formulation)
+        self.formulation = 'auto'
+
+        for name, value in parameters.items():
+            assert name in self.__dict__, 'Unknown parameter {}'.format(name)
+            setattr(self, name, value)
+
+        # При заданных узлах T и N определяются ими
+        if self.nodes is not None:
+            self.nodes = array(self.nodes, dtype=float)
+            self.T = self.nodes[-1]
+            self.N = len(self.nodes) - 1
+
         # Определение размерностей задачи
         self.n, self.r, self.m = self.get_dimensions()
         self.check_dimensions()
@@ -71,12 +98,18 @@ class Problem(object):
                  2) r --- размерность вектора управлений,
                  3) m --- количество ограничений на фазовый вектор в конечный момент времени
         """
-        n = len(self.A)
+        n = self.A.shape[0]
         r = len(self.L1)
-        m = len(self.H)
+        m = self.H.shape[0]
 
         return n, r, m
 
+    def get_nodes(self):
+        """
+        Узлы разбиения отрезка управления [0, T]
+        """
+        return linspace(0, self.T, self.N + 1) if self.nodes is None else self.nodes
+
     def check_dimensions(self) -> None:
         """
         Проверка соответствия размерностей параметров задачи
@@ -84,12 +117,12 @@ class Problem(object):
         assert self.n > 0, 'n = 0'
         assert self.r > 0, 'r = 0'
 
-        assert len(self.A[0]) == self.n, \
-            'Dimension of A is ({})x({})'.format(self.n, len(self.A[0]))
-        assert len(self.B) == self.n, \
-            'Number of rows of B is {} instead of {})'.format(len(self.B), self.n)
-        assert len(self.B[0]) == self.r, \
-            'Number of columns of B is {} instead of {})'.format(len(self.B[0]), self.r)
+        assert self.A.shape[1] == self.n, \
+            'Dimension of A is ({})x({})'.format(self.n, self.A.shape[1])
+        assert self.B.shape[0] == self.n, \
+            'Number of rows of B is {} instead of {})'.format(self.B.shape[0], self.n)
+        assert self.B.shape[1] == self.r, \
+            'Number of columns of B is {} instead of {})'.format(self.B.shape[1], self.r)
         assert len(self.C) == self.n, \
             'Dimension of C is {} instead of {})'.format(len(self.C), self.n)
 
@@ -99,15 +132,15 @@ class Problem(object):
         assert len(self.x0) == self.n, \
             'Dimension of x0 is {} instead of {})'.format(len(self.x0), self.n)
         if self.m > 0:
-            assert len(self.H[0]) == self.n, \
-                'Number of columns of H is {} instead of {})'.format(len(self.H[0]), self.n)
+            assert self.H.shape[1] == self.n, \
+                'Number of columns of H is {} instead of {})'.format(self.H.shape[1], self.n)
         assert len(self.g) == self.m, \
             'Dimension of g is {} instead of {})'.format(len(self.g), self.m)
 
-        assert len(self.Q) == self.n, \
-            'Number of rows of Q is {} instead of {})'.format(len(self.Q), self.n)
-        assert len(self.Q[0]) == self.n, \
-            'Number of columns of Q is {} instead of {})'.format(len(self.Q[0]), self.n)
+        assert self.Q.shape[0] == self.n, \
+            'Number of rows of Q is {} instead of {})'.format(self.Q.shape[0], self.n)
+        assert self.Q.shape[1] == self.n, \
+            'Number of columns of Q is {} instead of {})'.format(self.Q.shape[1], self.n)
         assert len(self.R) == self.r, \
             'Number of rows of R is {} instead of {})'.format(len(self.R), self.r)
         assert len(self.R[0]) == self.r, \
@@ -117,4 +150,11 @@ class Problem(object):
         assert len(self.c) == self.n, \
             'Dimension of c is {} instead of {})'.format(len(self.c), self.n)
 
-        print('All dimensions are correct')
+        assert self.basis in ('global', 'local'), 'Unknown basis {}'.format(self.basis)
+        assert self.formulation in ('auto', 'condensed', 'shooting'), 'Unknown formulation {}'.format(self.formulation)
+
+        if self.nodes is not None:
+            assert self.N > 0 and self.nodes[0] == 0., 'First node is not 0'
+            assert diff(self.nodes).min() > 0, 'Nodes are not increasing'
+
+        logger.info('All dimensions are correct')
@@ -1,33 +1,124 @@
-def run() -> None:
+import argparse
+
+
+# Режим управления: (модуль и функция поиска, дополнительные аргументы, модуль и функция расчёта движения).
+# Модули импортируются только при выполнении соответствующего этапа: импорт coptpy, scipy и matplotlib
+# занимает большую часть времени запуска
+MODES = {
+    'constant': ('control.PiecewiseConstantControl', 'search_piecewise_constant_control', {},
+                 'movement.ObjectMovement', 'calculate_movement'),
+    'linear': ('control.PiecewiseLinearControl', 'search_piecewise_linear_control', {},
+               'movement.ObjectMovement', 'calculate_movement'),
+    'quadratic': ('control.QuadraticSplineControl', 'search_quadratic_spline_control', {},
+                  'movement.ObjectMovement', 'calculate_movement'),
+    'cubic': ('control.SplineControl', 'search_spline_control', {'degree': 3},
+              'movement.ObjectMovement', 'calculate_movement'),
+}
+
+
+def get_function(module: str, name: str):
+    from importlib import import_module
+
+    return getattr(import_module(module), name)
+
+
+def save_results(path: str, results: dict) -> None:
+    """
+    Запись результатов: в файл .npz или в каталог с файлами <имя>.npy, которые можно открыть
+    без чтения в память (numpy.load(..., mmap_mode='r'))
+    """
+    from numpy import savez, save
+    import os
+
+    if path.endswith('.npz'):
+        savez(path, **results)
+        return
+
+    os.makedirs(path, exist_ok=True)
+    for name, value in results.items():
+        save(os.path.join(path, name + '.npy'), value)
+
+
+def parse_parameters(items) -> dict:
+    """
+    Параметры решателя из строк NAME=VALUE (значение --- число, иначе строка)
+    """
+    import json
+
+    parameters = {}
+    for item in items:
+        name, _, value = item.partition('=')
+        try:
+            parameters[name] = json.loads(value)
+        except ValueError:
+            parameters[name] = value
+
+    return parameters
+
+
+def parse_arguments(arguments=None):
+    parser = argparse.ArgumentParser(description='Optimal control search')
+    parser.add_argument('--mode', default='quadratic', choices=sorted(MODES))
+    parser.add_argument('--problem', help='problem file (.npz or .json with Problem parameters); '
+                                          'the built-in problem is used by default')
+    parser.add_argument('--output', help='.npz file or directory of .npy files for the results')
+    parser.add_argument('--no-simulate', action='store_true', help='write the coefficients only')
+    parser.add_argument('--profiles', help='JSON file of solver parameter profiles (see benchmark/SolverTuning.py)')
+    parser.add_argument('--parameter', action='append', default=[], metavar='NAME=VALUE',
+                        help='solver parameter overriding the profile of the mode (repeatable)')
+    parser.add_argument('--plot', action='store_true', help='plot the control and the state')
+    parser.add_argument('--figure', help='write the plots to a file instead (.png, .svg or .pdf)')
+    parser.add_argument('--phase', type=int, nargs=2, metavar=('I', 'J'),
+                        help='phase portrait of the state components I and J (from 0); by default 0 and 2 '
+                             'when the state has at least 3 components')
+
+    return parser.parse_args(arguments)
+
+
+def run(arguments=None) -> None:
     """
     Запуск поиска решения задачи оптимального управления
     """
-    from problem.ProblemStatement import Problem
-    from control.PiecewiseConstantControl import search_piecewise_constant_control
-    from control.PiecewiseLinearControl import search_piecewise_linear_control
-    from control.QuadraticSplineControl import search_quadratic_spline_control
-    from movement.PCCObjectMovement import calculate_pcc_movement
-    from movement.PLCObjectMovement import calculate_plc_movement
-    from movement.QSCObjectMovement import calculate_qsc_movement
-    from plotting.Plotting import plot
     from datetime import datetime
+    import logging
 
-    mode = 'quadratic'
-    P = Problem()
-    now = datetime.now()
-    if mode == 'constant':
-        u = search_piecewise_constant_control(P)
-        t_grid, x_grid, u_grid = calculate_pcc_movement(P, u)
-    elif mode == 'linear':
-        p = search_piecewise_linear_control(P)
-        t_grid, x_grid, u_grid = calculate_plc_movement(P, p)
-    elif mode == 'quadratic':
-        p = search_quadratic_spline_control(P)
-        t_grid, x_grid, u_grid = calculate_qsc_movement(P, p)
+    arguments = parse_arguments(arguments)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    if arguments.problem is None:
+        from problem.ProblemStatement import Problem
+        P = Problem()
     else:
-        exit(1)
-    print((datetime.now() - now).total_seconds())
-    plot(t_grid, x_grid, u_grid)
+        from problem.ProblemFile import load_problem
+        P = load_problem(arguments.problem)
+
+    if arguments.profiles is not None:
+        from control.SolverProfiles import load_profiles
+        load_profiles(arguments.profiles)
+
+    search_module, search_name, options, movement_module, movement_name = MODES[arguments.mode]
+    now = datetime.now()
+    coefficients = get_function(search_module, search_name)(P, parameters=parse_parameters(arguments.parameter),
+                                                            **options)
+    logging.getLogger(__name__).info('Search time: %s s', (datetime.now() - now).total_seconds())
+
+    results = {'coefficients': coefficients, 'nodes': P.get_nodes()}
+    if not arguments.no_simulate or arguments.plot or arguments.figure is not None:
+        t_grid, x_grid, u_grid = get_function(movement_module, movement_name)(P, coefficients)
+        results.update(t=t_grid, x=x_grid, u=u_grid)
+
+    if arguments.output is not None:
+        save_results(arguments.output, results)
+
+    phase = arguments.phase
+    if phase is None and P.n >= 3:
+        phase = (0, 2)
+    if arguments.figure is not None:
+        from plotting.Plotting import render
+        render(arguments.figure, results['t'], results['x'], results['u'], phase=phase)
+    elif arguments.plot:
+        from plotting.Plotting import plot
+        plot(results['t'], results['x'], results['u'], phase=phase)
 
 
 if __name__ == '__main__':
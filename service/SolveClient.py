@@ -0,0 +1,68 @@
+from problem.ProblemStatement import Problem
+from problem.ProblemFile import get_parameters, convert_to_json
+from service.SolveService import BINARY
+from numpy import load, savez, asarray, array
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+from time import sleep
+from io import BytesIO
+import json
+
+
+class SolveClient(object):
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765, binary: bool = False, retries: int = 20,
+                 timeout: float = 120.) -> None:
+        """
+        Клиент службы решения (см. SolveService)
+        :param binary: передавать задачи и результаты архивами .npz вместо JSON
+        :param retries: количество повторов запроса при перегрузке службы (ответ 503)
+        """
+        self.url = 'http://{}:{}'.format(host, port)
+        self.binary = binary
+        self.retries = retries
+        self.timeout = timeout
+
+    def send(self, path: str, body: bytes = None, content_type: str = None) -> tuple:
+        headers = {} if content_type is None else {'Content-Type': content_type}
+        for attempt in range(self.retries + 1):
+            try:
+                with urlopen(Request(self.url + path, body, headers), timeout=self.timeout) as response:
+                    return response.headers.get('Content-Type'), response.read()
+            except HTTPError as error:
+                if error.code != 503 or attempt == self.retries:
+                    raise RuntimeError('Solve service error {}: {}'.format(error.code, error.read().decode()))
+                sleep(min(float(error.headers.get('Retry-After', 1)), 0.05 * 2 ** attempt))
+
+    def get_status(self) -> dict:
+        return json.loads(self.send('/status')[1])
+
+    def solve(self, P: Problem, mode: str = 'quadratic') -> dict:
+        """
+        Решение задачи службой
+        :return: словарь: status, objective и coefficients (массив формы (r, N, order); оба None, если решение
+                 не найдено), solve_time и total_time (время решения и время от получения запроса до ответа, с)
+        """
+        parameters = get_parameters(P)
+        if self.binary:
+            stream = BytesIO()
+            savez(stream, mode=array(mode), **parameters)
+            content_type, body = self.send('/solve', stream.getvalue(), BINARY)
+        else:
+            request = json.dumps({'mode': mode, 'problem': convert_to_json(parameters)}).encode()
+            content_type, body = self.send('/solve', request, 'application/json')
+
+        if content_type == BINARY:
+            with load(BytesIO(body), allow_pickle=False) as file:
+                result = {name: file[name] for name in file.files}
+            result = {name: value if name == 'coefficients' else value.item() for name, value in result.items()}
+            result.setdefault('objective', None)
+            result.setdefault('coefficients', None)
+
+            return result
+
+        result = json.loads(body)
+        if result['coefficients'] is not None:
+            result['coefficients'] = asarray(result['coefficients'], dtype=float)
+
+        return result
@@ -0,0 +1,315 @@
+from problem.ProblemStatement import Problem
+from problem.ProblemFile import convert_parameters, convert_to_json
+from numerical.Cache import calculate_key
+from control.ParametricControl import ParametricController, get_mode
+from numpy import load, savez, asarray
+from coptpy import Envr, COPT
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from collections import OrderedDict
+from queue import Queue, Full, Empty
+from threading import Thread, Event, Lock
+from time import perf_counter
+from io import BytesIO
+import argparse
+import logging
+import json
+
+
+logger = logging.getLogger(__name__)
+
+# Тип содержимого запросов и ответов с массивами (архив .npz)
+BINARY = 'application/x-npz'
+
+# Параметры, от которых зависит модель; x0 и g входят только в правые части начальных и терминальных ограничений
+MODEL_PARAMETERS = ('A', 'B', 'C', 'L1', 'L2', 'H', 'Q', 'R', 'd', 'c', 'T', 'N', 'nodes', 'basis', 'formulation')
+
+
+class SolveRequest(object):
+
+    def __init__(self, P: Problem, mode: str) -> None:
+        self.P = P
+        self.mode = mode
+        self.key = calculate_key(mode, *[getattr(P, name) for name in MODEL_PARAMETERS])
+        self.data = calculate_key(P.x0, P.g)
+        self.received = perf_counter()
+        self.done = Event()
+        self.cancelled = False
+        self.result = None
+        self.error = None
+
+
+class SolveWorker(Thread):
+
+    def __init__(self, service, max_models: int = 16) -> None:
+        """
+        Поток-исполнитель со своим окружением решателя и моделями последних max_models систем:
+        для повторной системы меняются только правые части начальных и терминальных ограничений, решатель
+        начинает с базиса предыдущего решения, а предвычисления берутся из общего кэша процесса
+        """
+        super().__init__(daemon=True)
+        self.service = service
+        self.max_models = max_models
+        self.controllers = OrderedDict()
+        self.env = None
+
+    def get_controller(self, request: SolveRequest) -> ParametricController:
+        controller = self.controllers.get(request.key)
+        if controller is None:
+            controller = ParametricController(request.P, request.mode, self.env)
+            controller.M.setParam(COPT.Param.Logging, 0)
+            self.controllers[request.key] = controller
+            while len(self.controllers) > self.max_models:
+                self.controllers.popitem(last=False)
+        self.controllers.move_to_end(request.key)
+
+        return controller
+
+    def solve(self, controller: ParametricController, request: SolveRequest) -> dict:
+        controller.update(x0=request.P.x0, g=request.P.g)
+        start = perf_counter()
+        values = controller.solve()
+        optimal = controller.M.status == COPT.OPTIMAL
+
+        return {
+            'status': controller.M.status,
+            'objective': controller.M.objval if optimal else None,
+            'coefficients': values if optimal else None,
+            'solve_time': perf_counter() - start,
+        }
+
+    def solve_group(self, group: list) -> None:
+        """
+        Решение запросов одной системы на одной модели: запросы с одинаковыми x0 и g решаются один раз,
+        запросы, ответ на которые уже не ждут (см. SolveHandler.do_POST), пропускаются
+        """
+        results = {}
+        controller = None
+        for request in group:
+            if request.cancelled:
+                self.service.count('cancelled')
+                continue
+            try:
+                if request.data in results:
+                    self.service.count('shared')
+                else:
+                    if controller is None:
+                        controller = self.get_controller(request)
+                    results[request.data] = self.solve(controller, request)
+                request.result = dict(results[request.data], total_time=perf_counter() - request.received)
+            except Exception as error:
+                logger.exception('Solve failed')
+                request.error = str(error)
+            request.done.set()
+
+    def run(self) -> None:
+        self.env = Envr()
+        queue = self.service.queue
+        while True:
+            request = queue.get()
+            if request is None:
+                return
+
+            # Пакет из уже ожидающих запросов (без ожидания новых): запросы одной системы собираются в группу
+            # и решаются подряд на одной модели
+            batch = [request]
+            while len(batch) < self.service.batch_size:
+                try:
+                    request = queue.get_nowait()
+                except Empty:
+                    break
+                if request is None:
+                    queue.put(None)
+                    break
+                batch.append(request)
+            self.service.count_batch(len(batch))
+
+            groups = {}
+            for request in batch:
+                groups.setdefault(request.key, []).append(request)
+            for group in groups.values():
+                self.solve_group(group)
+
+
+class SolveHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *arguments) -> None:
+        logger.debug(format, *arguments)
+
+    def send_body(self, code: int, body: bytes, content_type: str, headers: dict = None) -> None:
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, code: int, data: dict, headers: dict = None) -> None:
+        # NaN и бесконечности не входят в JSON: вместо некорректного ответа клиент получает ошибку
+        try:
+            body = json.dumps(data, allow_nan=False)
+        except ValueError as error:
+            code, body = 500, json.dumps({'error': 'Invalid result: {}'.format(error)})
+        self.send_body(code, body.encode(), 'application/json', headers)
+
+    def do_GET(self) -> None:
+        if self.path != '/status':
+            self.send_json(404, {'error': 'Unknown path {}'.format(self.path)})
+            return
+        self.send_json(200, self.server.service.get_status())
+
+    def do_POST(self) -> None:
+        if self.path != '/solve':
+            self.send_json(404, {'error': 'Unknown path {}'.format(self.path)})
+            return
+
+        service = self.server.service
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        binary = self.headers.get('Content-Type') == BINARY
+        try:
+            request = parse_request(body, binary)
+        except (ValueError, KeyError, TypeError, AssertionError) as error:
+            self.send_json(400, {'error': 'Invalid request: {}'.format(error)})
+            return
+
+        # Ограниченная очередь: при перегрузке клиент получает отказ и повторяет запрос позже
+        try:
+            service.queue.put_nowait(request)
+        except Full:
+            self.send_json(503, {'error': 'Service is busy'}, {'Retry-After': '1'})
+            return
+
+        if not request.done.wait(service.timeout):
+            # Ответ уже отправлен, поэтому исполнитель не решает этот запрос
+            request.cancelled = True
+            self.send_json(504, {'error': 'Solve timed out'})
+            return
+        if request.error is not None:
+            self.send_json(500, {'error': request.error})
+            return
+
+        result = request.result
+        if binary:
+            arrays = {name: asarray(value) for name, value in result.items() if value is not None}
+            stream = BytesIO()
+            savez(stream, **arrays)
+            self.send_body(200, stream.getvalue(), BINARY)
+        else:
+            self.send_json(200, convert_to_json(result))
+
+
+def parse_request(body: bytes, binary: bool) -> SolveRequest:
+    """
+    Запрос в формате JSON ({"mode": ..., "problem": {параметры Problem}}) или архив .npz с массивами
+    параметров Problem и строкой mode
+    """
+    if binary:
+        with load(BytesIO(body), allow_pickle=False) as file:
+            parameters = {name: file[name] for name in file.files}
+        mode = parameters.pop('mode', None)
+        mode = 'quadratic' if mode is None else str(mode.item())
+    else:
+        data = json.loads(body)
+        parameters = data['problem']
+        mode = data.get('mode', 'quadratic')
+    get_mode(mode)
+
+    return SolveRequest(Problem(**convert_parameters(parameters)), mode)
+
+
+class SolveService(object):
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, workers: int = 1, capacity: int = 64,
+                 batch_size: int = 8, max_models: int = 16, timeout: float = 60.) -> None:
+        """
+        Локальная служба решения задач по HTTP: POST /solve (JSON или .npz), GET /status.
+        Процесс запускается один раз, поэтому импорт библиотек, создание окружений решателя и предвычисления
+        для повторяющихся систем не входят во время ответа
+        :param port: порт (0 --- выбирается свободный, см. address)
+        :param workers: количество потоков-исполнителей, у каждого своё окружение решателя
+        :param capacity: наибольшее количество ожидающих запросов, сверх которого служба отвечает 503
+        :param batch_size: наибольшее количество ожидающих запросов, которые исполнитель забирает из очереди
+                           за раз и группирует по системам
+        :param max_models: количество моделей, хранимых каждым исполнителем
+        :param timeout: наибольшее время ожидания решения одного запроса, с
+        """
+        self.queue = Queue(maxsize=capacity)
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.workers = [SolveWorker(self, max_models) for _ in range(workers)]
+        self.server = ThreadingHTTPServer((host, port), SolveHandler)
+        self.server.service = self
+        self.lock = Lock()
+        self.statistics = {'batches': 0, 'requests': 0, 'largest_batch': 0, 'shared': 0, 'cancelled': 0}
+        self.thread = None
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    def count_batch(self, size: int) -> None:
+        with self.lock:
+            self.statistics['batches'] += 1
+            self.statistics['requests'] += size
+            self.statistics['largest_batch'] = max(self.statistics['largest_batch'], size)
+
+    def count(self, name: str) -> None:
+        with self.lock:
+            self.statistics[name] += 1
+
+    def get_status(self) -> dict:
+        with self.lock:
+            return dict(self.statistics, queued=self.queue.qsize(), workers=len(self.workers))
+
+    def start(self) -> None:
+        """
+        Запуск исполнителей и сервера в фоновых потоках
+        """
+        for worker in self.workers:
+            worker.start()
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info('Solve service is listening on %s:%s', *self.address)
+
+    def serve_forever(self) -> None:
+        for worker in self.workers:
+            worker.start()
+        logger.info('Solve service is listening on %s:%s', *self.address)
+        try:
+            self.server.serve_forever()
+        finally:
+            self.stop()
+
+    def stop(self) -> None:
+        if self.thread is not None:
+            self.server.shutdown()
+            self.thread = None
+        self.server.server_close()
+        for worker in self.workers:
+            if worker.is_alive():
+                self.queue.put(None)
+        for worker in self.workers:
+            if worker.is_alive():
+                worker.join()
+
+
+def main(arguments=None) -> None:
+    parser = argparse.ArgumentParser(description='Local optimal control solve service')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--capacity', type=int, default=64)
+    parser.add_argument('--batch-size', type=int, default=8)
+    arguments = parser.parse_args(arguments)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    service = SolveService(arguments.host, arguments.port, arguments.workers, arguments.capacity,
+                           arguments.batch_size)
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+from control.PiecewiseConstantControl import is_native_supported, solve_piecewise_constant_control_natively, \
+    search_piecewise_constant_control
+from control.ParametricControl import ParametricController
+from benchmark.RandomProblems import generate_controllable_problem
+from instrumentation.Telemetry import Telemetry, record
+from numpy import full, abs as np_abs
+from coptpy import COPT
+import pytest
+
+
+@pytest.mark.parametrize('seed', range(6))
+def test_native_solver_matches_copt(seed):
+    P = generate_controllable_problem(n=4, r=2, m=2, N=20, T=5., seed=seed)
+    assert is_native_supported(P)
+
+    u, _, _, converged = solve_piecewise_constant_control_natively(P)
+    controller = ParametricController(P, 'constant')
+    controller.M.setParam(COPT.Param.Logging, 0)
+    values = controller.solve()
+
+    assert converged
+    assert controller.M.status == COPT.OPTIMAL
+    assert np_abs(u - values.reshape(-1)).max() <= 1e-6 * max(1., np_abs(values).max())
+
+
+def test_native_solver_falls_back_to_copt():
+    """
+    При недостижимой цели (управление почти нулевое) собственный решатель не сходится, и задача решается COPT
+    """
+    P = generate_controllable_problem(n=4, r=2, m=2, N=20, T=5., seed=0)
+    P.L1 = full(P.r, -1e-3)
+    P.L2 = full(P.r, 1e-3)
+
+    telemetry = Telemetry()
+    with record(telemetry):
+        search_piecewise_constant_control(P, backend='native', parameters={'Logging': 0})
+    solves = telemetry.to_dict()['solves']
+
+    assert [solve['solver'] for solve in solves] == ['native', 'copt']
+    assert not solves[0]['converged']
+    assert solves[1]['status'] == COPT.INFEASIBLE
@@ -0,0 +1,44 @@
+from problem.ProblemStatement import Problem
+from control.ParametricControl import ParametricController
+from control.PiecewisePolynomialControl import PiecewisePolynomialControl
+from numpy import linspace, abs as np_abs
+from numpy.random import default_rng
+from coptpy import COPT
+import pytest
+
+
+@pytest.mark.parametrize('basis', ['global', 'local'])
+@pytest.mark.parametrize('mode', ['constant', 'linear', 'quadratic'])
+def test_prediction_matches_resolve(mode, basis):
+    """
+    Прогноз при малом изменении g совпадает с повторным решением. Эталон --- решение в базисе 'local':
+    в базисе 'global' задача плохо обусловлена, и решатель находит сплайны второй степени с ошибкой
+    того же порядка, что и изменение решения; поэтому сравниваются управления на сетке
+    """
+    P = Problem()
+    P.basis = basis
+    controller = ParametricController(P, mode)
+    controller.M.setParam(COPT.Param.Logging, 0)
+    initial = controller.solve()
+    sensitivity = controller.get_sensitivity()
+
+    g = P.g + 1e-3 * default_rng(0).normal(size=P.m)
+    predicted, estimate = sensitivity.predict(g=g)
+
+    reference = Problem()
+    reference.basis = 'local'
+    reference.g = g
+    resolver = ParametricController(reference, mode)
+    resolver.M.setParam(COPT.Param.Logging, 0)
+    resolved = resolver.solve()
+
+    t = linspace(0, P.T, 2001)
+    nodes = P.get_nodes()
+    u_initial, u_predicted = [PiecewisePolynomialControl(values, nodes, basis)(t) for values in (initial, predicted)]
+    u_resolved = PiecewisePolynomialControl(resolved, nodes, 'local')(t)
+    change = np_abs(u_resolved - u_initial).max()
+
+    assert not estimate['resolve']
+    assert change > 0
+    assert np_abs(u_predicted - u_resolved).max() <= 1e-2 * change
+    assert abs(estimate['objective'] - resolver.M.objval) <= 1e-6 * abs(resolver.M.objval)
@@ -0,0 +1,180 @@
+from numerical.TerminalCoefficients import calculate_terminal_projections
+from control.MatrixModel import calculate_power_row, calculate_gram_matrices, get_values
+from control.SplineControl import build_spline_model
+from control.PiecewiseConstantControl import build_piecewise_constant_model
+from control.Sensitivity import get_quadratic_objective
+from benchmark.RandomProblems import generate_controllable_problem
+from numpy import array, allclose
+from numpy.testing import assert_allclose
+from coptpy import Envr, Model, QuadExpr, LinExpr, tuplelist, COPT
+from math import comb
+import pytest
+
+
+def build_reference_model(M: Model, P, degree: int, subdivisions: int):
+    """
+    Построение той же модели по одному ограничению (как до перехода на матричный интерфейс)
+    """
+    order = degree + 1
+    nodes = P.get_nodes()
+    widths = nodes[1:] - nodes[:-1]
+    local = P.basis == 'local'
+    r, N = P.r, P.N
+    p = M.addVars(tuplelist((i, k, o) for i in range(r) for k in range(N) for o in range(order)),
+                  lb=-COPT.INFINITY, vtype=COPT.CONTINUOUS, nameprefix='p')
+
+    # Непрерывность управления и производных до порядка degree-1 во внутренних узлах
+    for derivative in range(degree):
+        for i in range(r):
+            for k in range(1, N):
+                # В базисе 'local' узел --- конец tau = 1 левого отрезка и начало tau = 0 правого
+                if local:
+                    left = calculate_power_row(1., order, derivative) * widths[k - 1] ** -float(derivative)
+                    right = calculate_power_row(0., order, derivative) * widths[k] ** -float(derivative)
+                else:
+                    left = right = calculate_power_row(nodes[k], order, derivative)
+                M.addConstr(LinExpr(sum(left[o] * p[i, k - 1, o] - right[o] * p[i, k, o] for o in range(order))) == 0.,
+                            name='smoothness_constraint_{}_{}_{}'.format(derivative, i, k))
+
+    # Коэффициенты Бернштейна на частях отрезков
+    rows = []
+    for i in range(r):
+        for k in range(N):
+            width = (1. if local else widths[k]) / subdivisions
+            for s in range(subdivisions):
+                start = (0. if local else nodes[k]) + s * width
+                for l in range(order):
+                    coefficients = [sum(comb(l, j) / comb(degree, j) * width ** j * comb(o, j) * start ** (o - j)
+                                        for j in range(min(l, o) + 1)) for o in range(order)]
+                    rows.append((i, LinExpr(sum(coefficients[o] * p[i, k, o] for o in range(order)))))
+    for i, expression in rows:
+        M.addConstr(expression >= P.L1[i], name='lower_straight_constraint_{}'.format(i))
+    for i, expression in rows:
+        M.addConstr(expression <= P.L2[i], name='upper_straight_constraint_{}'.format(i))
+
+    HxT, HD, cD = calculate_terminal_projections(P.A, P.B, P.C, P.x0, P.H, P.c, nodes, order, basis=P.basis)
+    h = P.g - HxT
+    terminal = [M.addConstr(LinExpr(sum(HD[i, k, o, l] * p[i, k, o] for i in range(r) for k in range(N)
+                                        for o in range(order))) == h[l], name='terminal_constraint_{}'.format(l))
+                for l in range(P.m)]
+
+    G = calculate_gram_matrices(nodes, order, P.basis)
+    objective = QuadExpr(0)
+    for k in range(N):
+        for i1 in range(r):
+            for i2 in range(r):
+                if abs(P.R[i1, i2]) <= 1e-15:
+                    continue
+                for o1 in range(order):
+                    for o2 in range(order):
+                        objective += P.R[i1, i2] * G[k, o1, o2] * p[i1, k, o1] * p[i2, k, o2]
+    for i in range(r):
+        for k in range(N):
+            for o in range(order):
+                objective += cD[i, k, o] * p[i, k, o]
+    M.setObjective(objective, sense=COPT.MINIMIZE)
+
+    return p, terminal
+
+
+def build_reference_constant_model(M: Model, P):
+    """
+    Кусочно-постоянная модель по одному ограничению: границы переменных, разложение |u_i| = v1 + v2
+    и веса членов d*|u(t)|
+    """
+    nodes = P.get_nodes()
+    widths = nodes[1:] - nodes[:-1]
+    r, N = P.r, P.N
+    u = M.addVars(tuplelist((i, k) for i in range(r) for k in range(N)),
+                  lb=[P.L1[i] for i in range(r) for _ in range(N)], ub=[P.L2[i] for i in range(r) for _ in range(N)],
+                  vtype=COPT.CONTINUOUS, nameprefix='u')
+
+    HxT, HD, cD = calculate_terminal_projections(P.A, P.B, P.C, P.x0, P.H, P.c, nodes, 1, basis=P.basis)
+    h = P.g - HxT
+    terminal = [M.addConstr(LinExpr(sum(HD[i, k, 0, l] * u[i, k] for i in range(r) for k in range(N))) == h[l],
+                            name='terminal_constraint_{}'.format(l)) for l in range(P.m)]
+
+    objective = QuadExpr(0)
+    for k in range(N):
+        for i1 in range(r):
+            for i2 in range(r):
+                if abs(P.R[i1, i2]) > 1e-15:
+                    objective += P.R[i1, i2] * widths[k] * u[i1, k] * u[i2, k]
+    split = []
+    for i in range(r):
+        if abs(P.d[i]) <= 1e-15:
+            continue
+        if P.L1[i] > -1e-15 or P.L2[i] < 1e-15:
+            sign = 1. if P.L1[i] > -1e-15 else -1.
+            for k in range(N):
+                objective += sign * P.d[i] * widths[k] * u[i, k]
+        else:
+            split.append(i)
+    if split:
+        keys = tuplelist((i, k) for i in split for k in range(N))
+        v1 = M.addVars(keys, lb=0., ub=[-P.L1[i] for i, _ in keys], vtype=COPT.CONTINUOUS, nameprefix='v1')
+        v2 = M.addVars(keys, lb=0., ub=[P.L2[i] for i, _ in keys], vtype=COPT.CONTINUOUS, nameprefix='v2')
+        for i, k in keys:
+            M.addConstr(u[i, k] - v2[i, k] + v1[i, k] == 0., name='abs_split_constraint_{}_{}'.format(i, k))
+            objective += P.d[i] * widths[k] * (v1[i, k] + v2[i, k])
+    for i in range(r):
+        for k in range(N):
+            objective += cD[i, k, 0] * u[i, k]
+    M.setObjective(objective, sense=COPT.MINIMIZE)
+
+    return u, terminal
+
+
+def get_model_data(M: Model):
+    constraints = M.getConstrs()
+    variables = M.getVars()
+    G, q = get_quadratic_objective(M)
+
+    return {
+        'matrix': M.getA().toarray(),
+        'lower': array(M.getInfo(COPT.Info.LB, constraints)),
+        'upper': array(M.getInfo(COPT.Info.UB, constraints)),
+        'variable_lower': array(M.getInfo(COPT.Info.LB, variables)),
+        'variable_upper': array(M.getInfo(COPT.Info.UB, variables)),
+        'hessian': G.toarray(),
+        'linear': q,
+    }
+
+
+@pytest.mark.parametrize('basis', ['global', 'local'])
+@pytest.mark.parametrize('degree', [0, 1, 2])
+def test_matrix_builder_matches_reference(degree, basis):
+    P = generate_controllable_problem(n=4, r=2, m=2, N=6, T=5., seed=0)
+    # Неравномерные узлы: в базисе 'local' условия гладкости зависят от длин соседних отрезков
+    P.nodes = array([0., 0.5, 1.5, 2., 3.5, 4., 5.])
+    P.basis = basis
+    subdivisions = 1 if degree <= 1 else 2
+    env = Envr()
+
+    M = env.createModel('matrix')
+    M.setParam(COPT.Param.Logging, 0)
+    reference = env.createModel('reference')
+    reference.setParam(COPT.Param.Logging, 0)
+    if degree == 0:
+        # Член d*|u(t)| с разложением модуля у первого входа и знакопостоянным вторым входом
+        P.d = array([0.5, 0.3])
+        P.L1 = array([P.L1[0], 0.])
+        x, _ = build_piecewise_constant_model(M, P)
+        p, _ = build_reference_constant_model(reference, P)
+    else:
+        x, _ = build_spline_model(M, P, degree)
+        p, _ = build_reference_model(reference, P, degree, subdivisions)
+
+    data = get_model_data(M)
+    expected = get_model_data(reference)
+    assert data['matrix'].shape == expected['matrix'].shape
+    for name in expected:
+        scale = max(1., abs(expected[name][abs(expected[name]) < COPT.INFINITY]).max(initial=0.))
+        assert allclose(data[name], expected[name], rtol=1e-9, atol=1e-9 * scale), name
+
+    M.solve()
+    reference.solve()
+    assert M.status == reference.status == COPT.OPTIMAL
+    assert_allclose(M.objval, reference.objval, rtol=1e-7)
+    values = array([p[key].x for key in sorted(p.keys())])
+    assert_allclose(get_values(x), values, rtol=1e-5, atol=1e-6)